@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Single-pass, mergeable aggregation of the answer data.
+"""
+import heapq
+import math
+from collections import OrderedDict
+
+import constants
+from columnar import DistinctIds
+
+
+class ScoreHistogram(object):
+    """ A streaming sketch of a distribution of integer scores, for percentile queries.
+
+    The scores are counted per value, so that the memory depends on the number of distinct
+    scores only, and the percentiles are exact. Histograms are merged by adding their counts.
+    """
+    __slots__ = ('counts', 'total')
+
+    def __init__(self, counts=None):
+        """ Return a ScoreHistogram object with the given {score: count} dictionary. """
+        self.counts = dict(counts or {})
+        self.total = sum(self.counts.values())
+
+    def add(self, score):
+        """ Count one more occurrence of score. """
+        self.counts[score] = self.counts.get(score, 0) + 1
+        self.total += 1
+
+    def merge(self, other):
+        """ Add the counts of another ScoreHistogram to this one. """
+        for score, count in other.counts.items():
+            self.counts[score] = self.counts.get(score, 0) + count
+        self.total += other.total
+        return self
+
+    def percentile(self, percent):
+        """ Return the nearest-rank percentile of the scores, or 0 if there are none.
+
+        :param (float) percent: A number in the (0, 100] range.
+        """
+        rank = max(1, int(math.ceil(percent / 100.0 * self.total)))
+        for score in sorted(self.counts):
+            rank -= self.counts[score]
+            if rank <= 0:
+                return score
+        return 0
+
+
+class TopK(object):
+    """ Selects the k highest scored answers from a stream of answers, in O(k) memory.
+
+    The answers are kept in a bounded min-heap of [score, answer_id] pairs, so that the order
+    in which the answers arrive (pages, sub-windows, cached partials) does not matter.
+
+    :param (int) k: The number of answers to select.
+    """
+    __slots__ = ('k', 'heap')
+
+    def __init__(self, k):
+        """ Return an empty TopK object. """
+        self.k = k
+        self.heap = []
+
+    def push(self, score, answer_id):
+        """ Keep the answer if it is one of the k highest scored answers so far. """
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, [score, answer_id])
+        elif [score, answer_id] > self.heap[0]:
+            heapq.heapreplace(self.heap, [score, answer_id])
+
+    def merge(self, other):
+        """ Keep the k highest scored answers of this and another TopK object. """
+        for score, answer_id in other.heap:
+            self.push(score, answer_id)
+        return self
+
+    def items(self):
+        """ Return the selected answers as [score, answer_id] pairs, in descending score order. """
+        return sorted(self.heap, reverse=True)
+
+
+class StatisticsAggregator(object):
+    """ Updates all the statistics of the answer data in a single pass over the answer items.
+
+    Aggregators of disjoint sets of answers (sub-windows, threads, processes or stored partials)
+    are combined with merge. Apart from the distinct question ids, which the average number of
+    answers per question needs and which are kept in a sorted array of 8 bytes per id, the memory
+    is bounded by the number of distinct scores and top.
+
+    :param (int) top: The number of highest scored answers whose comments are counted.
+    """
+    __slots__ = ('answer_count', 'question_ids', 'accepted_score_sum', 'accepted_scores',
+                 'top_answers', 'comments_per_answer')
+
+    def __init__(self, top=constants.TOP_ANSWERS):
+        """ Return an empty StatisticsAggregator object. """
+        self.answer_count = 0
+        self.question_ids = DistinctIds()
+        self.accepted_score_sum = 0
+        self.accepted_scores = ScoreHistogram()
+        self.top_answers = TopK(top)
+        self.comments_per_answer = dict()
+
+    def update(self, item):
+        """ Add an answer item to the statistics.
+
+        :param (dict) item: An answer item, as returned by the API.
+        """
+        self.answer_count += 1
+        self.question_ids.add(item['question_id'])
+        if item['is_accepted']:
+            self.accepted_score_sum += item['score']
+            self.accepted_scores.add(item['score'])
+        self.top_answers.push(item['score'], item['answer_id'])
+        return self
+
+    def update_columns(self, answer_columns):
+        """ Add the answers of an AnswerColumns object to the statistics, with vectorized operations.
+
+        :param (AnswerColumns) answer_columns: The answers, stored by column.
+        """
+        self.answer_count += len(answer_columns)
+        self.question_ids.update(answer_columns.distinct_question_ids())
+        accepted_scores = answer_columns.accepted_scores()
+        self.accepted_score_sum += answer_columns.accepted_score_sum(accepted_scores)
+        self.accepted_scores.merge(ScoreHistogram(answer_columns.value_counts(accepted_scores)))
+        for score, answer_id in answer_columns.top(self.top):
+            self.top_answers.push(score, answer_id)
+        return self
+
+    def merge(self, other):
+        """ Add the statistics of another StatisticsAggregator, of a disjoint set of answers, to this one. """
+        self.answer_count += other.answer_count
+        self.question_ids.update(other.question_ids)
+        self.accepted_score_sum += other.accepted_score_sum
+        self.accepted_scores.merge(other.accepted_scores)
+        self.top_answers.merge(other.top_answers)
+        self.comments_per_answer.update(other.comments_per_answer)
+        return self
+
+    def freeze(self):
+        """ Settle the buffered state, so that the aggregator can be read, or merged into others, by several
+        threads at once. Adding answers to it afterwards is not thread-safe.
+        """
+        self.question_ids.compact()
+        return self
+
+    @property
+    def top(self):
+        """ The number of highest scored answers whose comments are counted. """
+        return self.top_answers.k
+
+    def top_answer_ids(self):
+        """ Return the ids of the highest scored answers, in descending score order. """
+        return [answer_id for _, answer_id in self.top_answers.items()]
+
+    def result(self):
+        """ Create and return a dictionary with the results.
+
+        The comments of the highest scored answers that have not been counted are reported as 0,
+        in descending score order of the answers.
+        """
+        result_dict = dict()
+        result_dict['total_accepted_answers'] = self.accepted_scores.total
+        result_dict['accepted_answers_average_score'] = round(
+            self.accepted_score_sum / float(self.accepted_scores.total) if self.accepted_scores.total else 0.0, 2)
+        result_dict['accepted_answers_median_score'] = self.accepted_scores.percentile(50)
+        result_dict['accepted_answers_p90_score'] = self.accepted_scores.percentile(90)
+        result_dict['average_answers_per_question'] = round(
+            self.answer_count / float(len(self.question_ids)) if self.question_ids else 0.0, 2)
+        result_dict['top_ten_answers_comment_count'] = OrderedDict(
+            (answer_id, self.comments_per_answer.get(answer_id, 0)) for answer_id in self.top_answer_ids())
+        return result_dict
+
+    def to_dict(self):
+        """ Return the state of the aggregator as a JSON serializable dictionary. """
+        return {'top': self.top,
+                'answer_count': self.answer_count,
+                'question_ids': list(self.question_ids),
+                'accepted_score_sum': self.accepted_score_sum,
+                'accepted_scores': sorted(self.accepted_scores.counts.items()),
+                'top_answers': self.top_answers.items(),
+                'comments_per_answer': sorted(self.comments_per_answer.items())}
+
+    @classmethod
+    def from_dict(cls, state):
+        """ Return a StatisticsAggregator object from the state returned by to_dict. """
+        aggregator = cls(state['top'])
+        aggregator.answer_count = state['answer_count']
+        aggregator.question_ids = DistinctIds(state['question_ids'])
+        aggregator.accepted_score_sum = state['accepted_score_sum']
+        aggregator.accepted_scores = ScoreHistogram(dict((score, count) for score, count in state['accepted_scores']))
+        for score, answer_id in state['top_answers']:
+            aggregator.top_answers.push(score, answer_id)
+        aggregator.comments_per_answer = dict((answer_id, count) for answer_id, count in state['comments_per_answer'])
+        return aggregator
+
+    def __getstate__(self):
+        """ Support pickling, to pass aggregators between processes. """
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        """ Support unpickling, to pass aggregators between processes. """
+        aggregator = StatisticsAggregator.from_dict(state)
+        for attribute in StatisticsAggregator.__slots__:
+            setattr(self, attribute, getattr(aggregator, attribute))
+
+    def __eq__(self, other):
+        """ Aggregators are equal when their states are. """
+        return isinstance(other, StatisticsAggregator) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        """ Aggregators are equal when their states are. """
+        return not self == other
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Persistent, on-disk caches of the StackExchange API responses and of the partial aggregates.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+
+import constants
+from aggregation import StatisticsAggregator
+
+
+class ResponseCache(object):
+    """ Stores the JSON objects of successful API responses in a SQLite database, zlib compressed.
+
+    The entries are keyed by the normalized request url and expire after their own time-to-live.
+    When the compressed entries exceed max_bytes, the least recently used ones are evicted.
+
+    :param (str) directory: The directory of the cache database, created if missing.
+    :param (int) max_bytes: The maximum total size of the compressed entries.
+    """
+    def __init__(self, directory, max_bytes=constants.CACHE_MAX_BYTES):
+        """ Return a ResponseCache object whose database lives in directory. """
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, constants.CACHE_DATABASE_NAME),
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                     'key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, '
+                                     'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+
+    def get(self, url):
+        """ Return the cached JSON object of the url, or None if it is missing or expired.
+
+        :param (str) url: The request url.
+        """
+        key = ResponseCache.normalize(url)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT body, expires_at FROM responses WHERE key = ?',
+                                           (key,)).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return None
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, url, response_json, ttl):
+        """ Store the JSON object of the url for ttl seconds, evicting the least recently used entries if needed.
+
+        :param (str) url: The request url.
+        :param (dict) response_json: The JSON object of the response.
+        :param (int) ttl: The time-to-live of the entry, in seconds.
+        """
+        body = sqlite3.Binary(zlib.compress(json.dumps(response_json)))
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                     (ResponseCache.normalize(url), body, len(body), now + ttl, now))
+            self._evict()
+
+    def close(self):
+        """ Close the cache database. """
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self):
+        """ Delete the expired entries and then the least recently used ones, until the cache fits max_bytes. """
+        self._connection.execute('DELETE FROM responses WHERE expires_at < ?', (time.time(),))
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        evicted_keys = []
+        for key, size in self._connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if total_size <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._connection.executemany('DELETE FROM responses WHERE key = ?', evicted_keys)
+
+    @staticmethod
+    def normalize(url):
+        """ Return the url with its query parameters sorted, so that equivalent requests share a key. """
+        scheme, authority, path, query, _ = urlsplit(url)
+        return urlunsplit((scheme, authority.lower(), path, urlencode(sorted(parse_qsl(query))), ''))
+
+
+class PartialStore(object):
+    """ Stores the partial aggregates of sub-windows in a SQLite database, for incremental runs.
+
+    :param (str) directory: The directory of the partials database, created if missing.
+    """
+    def __init__(self, directory):
+        """ Return a PartialStore object whose database lives in directory. """
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(os.path.join(directory, constants.PARTIALS_DATABASE_NAME))
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS partials ('
+                                     'fromdate INTEGER NOT NULL, todate INTEGER NOT NULL, partial TEXT NOT NULL, '
+                                     'PRIMARY KEY (fromdate, todate))')
+
+    def load(self, windows):
+        """ Return the stored partials of the given sub-windows.
+
+        :param (list) windows: A list of (fromdate, todate) timestamp tuples.
+        :returns: A dictionary with the StatisticsAggregator objects of the stored sub-windows, keyed by sub-window.
+        """
+        partials = dict()
+        for window in windows:
+            row = self._connection.execute('SELECT partial FROM partials WHERE fromdate = ? AND todate = ?',
+                                           window).fetchone()
+            if row is not None:
+                partials[window] = StatisticsAggregator.from_dict(json.loads(row[0]))
+        return partials
+
+    def save(self, partials):
+        """ Store the partials of sub-windows, replacing the previous ones.
+
+        :param (dict) partials: A dictionary with StatisticsAggregator objects, keyed by (fromdate, todate)
+                                timestamp tuple.
+        """
+        with self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO partials VALUES (?, ?, ?)',
+                                         [(window[0], window[1], json.dumps(partial.to_dict()))
+                                          for window, partial in partials.items()])
+
+    def close(self):
+        """ Close the partials database. """
+        self._connection.close()
+
+
+class CommentCountMemo(object):
+    """ Remembers the number of comments of answers, in memory and, optionally, in a SQLite database shared by runs.
+
+    A count stays fresh for COMMENT_COUNT_TTL_AGE_SHARE of the age the answer had when it was counted,
+    between the time-to-lives of the pages of open and of closed sub-windows. The answers whose counts
+    are being retrieved are claimed, so that concurrent lookups of the same answers wait for that
+    retrieval instead of repeating it.
+
+    :param (str) directory: The directory of the database, created if missing, or None to remember the
+                            counts in memory only.
+    """
+    def __init__(self, directory=None):
+        """ Return a CommentCountMemo object, whose database lives in directory if given. """
+        self._counts = dict()
+        self._claims = dict()
+        self._lock = threading.Lock()
+        self._connection = None
+        if directory is None:
+            return
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._connection = sqlite3.connect(os.path.join(directory, constants.COMMENT_COUNTS_DATABASE_NAME),
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS comment_counts ('
+                                     'answer_id INTEGER PRIMARY KEY, comment_count INTEGER NOT NULL, '
+                                     'expires_at REAL NOT NULL)')
+            self._connection.execute('DELETE FROM comment_counts WHERE expires_at < ?', (time.time(),))
+
+    def claim(self, answer_ids):
+        """ Look up the counts of answers, claiming the ones to be retrieved by the caller.
+
+        The caller must put the counts of the claimed answers, or release them, once retrieved.
+
+        :param answer_ids: An iterable of answer ids.
+        :returns: A tuple with a {answer_id: count} dictionary of the fresh counts, a list of the claimed
+                  answer ids and a {answer_id: event} dictionary of the answers claimed by other callers,
+                  whose events are set once their retrievals end.
+        """
+        answer_ids = set(answer_ids)
+        now = time.time()
+        counts, claimed, claimed_by_others = dict(), [], dict()
+        with self._lock:
+            self._load([answer_id for answer_id in answer_ids if answer_id not in self._counts])
+            for answer_id in answer_ids:
+                count, expires_at = self._counts.get(answer_id, (0, 0))
+                if expires_at > now:
+                    counts[answer_id] = count
+                elif answer_id in self._claims:
+                    claimed_by_others[answer_id] = self._claims[answer_id]
+                else:
+                    self._claims[answer_id] = threading.Event()
+                    claimed.append(answer_id)
+        return counts, claimed, claimed_by_others
+
+    def put(self, counts, creation_dates):
+        """ Remember the counts of answers, fresh for a time-to-live depending on their age, and release them.
+
+        :param (dict) counts: The counts, keyed by answer id.
+        :param (dict) creation_dates: The creation timestamps of the answers, or later ones if only a bound
+                                      is known, keyed by answer id.
+        """
+        now = time.time()
+        rows = [(answer_id, count, now + CommentCountMemo.ttl(now - creation_dates.get(answer_id, now)))
+                for answer_id, count in counts.items()]
+        with self._lock:
+            self._counts.update((answer_id, (count, expires_at)) for answer_id, count, expires_at in rows)
+            if self._connection is not None:
+                with self._connection:
+                    self._connection.executemany('INSERT OR REPLACE INTO comment_counts VALUES (?, ?, ?)', rows)
+        self.release(counts.keys())
+
+    def release(self, answer_ids):
+        """ Release the claims of answers, waking up the callers waiting for them. """
+        with self._lock:
+            for answer_id in answer_ids:
+                event = self._claims.pop(answer_id, None)
+                if event is not None:
+                    event.set()
+
+    @staticmethod
+    def ttl(age):
+        """ Return the seconds the comment count of an answer of the given age, in seconds, stays fresh. """
+        return min(max(age * constants.COMMENT_COUNT_TTL_AGE_SHARE, constants.CACHE_TTL_OPEN_WINDOW),
+                   constants.CACHE_TTL_CLOSED_WINDOW)
+
+    def close(self):
+        """ Close the database, if any. """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+
+    def _load(self, answer_ids):
+        """ Load the stored counts of answers into memory, a few hundred ids per query. """
+        if self._connection is None:
+            return
+        for start in range(0, len(answer_ids), constants.SQLITE_MAX_VARIABLES):
+            batch = answer_ids[start:start + constants.SQLITE_MAX_VARIABLES]
+            self._counts.update((answer_id, (count, expires_at)) for answer_id, count, expires_at in
+                                self._connection.execute('SELECT answer_id, comment_count, expires_at FROM '
+                                                         'comment_counts WHERE answer_id IN ({0})'
+                                                         .format(', '.join('?' * len(batch))), batch))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compact, column-oriented storage of the answer data, with vectorized statistics.
+"""
+import heapq
+from array import array
+from itertools import compress, izip
+from collections import Counter
+
+_NOT_IMPORTED = object()
+_numpy = _NOT_IMPORTED
+
+
+def numpy_module():
+    """ Return the numpy module, imported on first use, or None if numpy is not installed. """
+    global _numpy
+    if _numpy is _NOT_IMPORTED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+class DistinctIds(object):
+    """ A set of integer ids, stored as a sorted array of 8 bytes per id instead of a hash set.
+
+    The added ids are buffered in a small set, which is merged into the array once it grows to
+    an eighth of it, so that the merges cost O(n log n) overall.
+
+    :param ids: An iterable of integer ids.
+    """
+    __slots__ = ('_sorted', '_pending')
+    MIN_PENDING = 4096
+
+    def __init__(self, ids=()):
+        """ Return a DistinctIds object with the given ids. """
+        self._sorted = array('l')
+        self._pending = set()
+        self.update(ids)
+
+    def add(self, id_):
+        """ Add an id to the set. """
+        self._pending.add(id_)
+        if len(self._pending) >= max(DistinctIds.MIN_PENDING, len(self._sorted) // 8):
+            self._merge()
+
+    def update(self, ids):
+        """ Add every id of an iterable, or of another DistinctIds object, to the set. """
+        self._pending.update(ids)
+        if len(self._pending) >= max(DistinctIds.MIN_PENDING, len(self._sorted) // 8):
+            self._merge()
+
+    def __len__(self):
+        self._merge()
+        return len(self._sorted)
+
+    def __iter__(self):
+        """ Iterate over the ids in ascending order. """
+        self._merge()
+        return iter(self._sorted)
+
+    def compact(self):
+        """ Merge the buffered ids into the sorted array, so that reading the set no longer changes it. """
+        self._merge()
+        return self
+
+    def _merge(self):
+        """ Merge the buffered ids into the sorted array. """
+        if not self._pending:
+            return
+        numpy = numpy_module()
+        if numpy is None:
+            self._sorted = array('l', sorted(self._pending.union(self._sorted)))
+        else:
+            merged = numpy.union1d(numpy.frombuffer(self._sorted, dtype='l'),
+                                   numpy.fromiter(self._pending, dtype='l', count=len(self._pending)))
+            self._sorted = array('l')
+            self._sorted.fromstring(merged.tostring())
+        self._pending = set()
+
+
+class AnswerColumns(object):
+    """ Stores the answers as one array per field, instead of a dictionary per answer.
+
+    The answer_id, question_id, score and creation_date columns take 8 bytes per answer and the
+    is_accepted column one byte. The statistics are computed on the whole columns at once, with
+    NumPy when it is installed, reading the arrays in place, or with the builtin C-level functions
+    over the arrays otherwise.
+    """
+    FIELDS = ('answer_id', 'question_id', 'score', 'is_accepted', 'creation_date')
+    __slots__ = FIELDS
+
+    def __init__(self, items=()):
+        """ Return an AnswerColumns object with the given answer items. """
+        self.answer_id = array('l')
+        self.question_id = array('l')
+        self.score = array('l')
+        self.is_accepted = array('b')
+        self.creation_date = array('l')
+        self.extend(items)
+
+    def __len__(self):
+        return len(self.answer_id)
+
+    def append(self, item):
+        """ Add an answer item, as returned by the API. """
+        self.answer_id.append(item['answer_id'])
+        self.question_id.append(item['question_id'])
+        self.score.append(item['score'])
+        self.is_accepted.append(item['is_accepted'])
+        self.creation_date.append(item['creation_date'])
+
+    def extend(self, items):
+        """ Add every answer item of an iterable, as returned by the API. """
+        for item in items:
+            self.append(item)
+        return self
+
+    def column(self, field):
+        """ Return a column as a NumPy array sharing the memory of the stored array, or the array itself.
+
+        The NumPy array is only valid until the next answer is added.
+        """
+        numpy = numpy_module()
+        values = getattr(self, field)
+        return values if numpy is None else numpy.frombuffer(values, dtype=values.typecode)
+
+    def accepted_scores(self):
+        """ Return the scores of the accepted answers, masked by the is_accepted column. """
+        numpy = numpy_module()
+        if numpy is None:
+            return array('l', compress(self.score, self.is_accepted))
+        return self.column('score')[self.column('is_accepted').astype(bool)]
+
+    def accepted_score_sum(self, accepted_scores=None):
+        """ Return the sum of the scores of the accepted answers, or of the given accepted scores. """
+        if accepted_scores is None:
+            accepted_scores = self.accepted_scores()
+        return int(sum(accepted_scores) if numpy_module() is None else accepted_scores.sum())
+
+    def distinct_question_ids(self):
+        """ Return the distinct question ids, as a list of integers. """
+        numpy = numpy_module()
+        if numpy is None:
+            return list(set(self.question_id))
+        return numpy.unique(self.column('question_id')).tolist()
+
+    @staticmethod
+    def value_counts(values):
+        """ Return a {value: count} dictionary of the values of a column. """
+        numpy = numpy_module()
+        if numpy is None:
+            return dict(Counter(values))
+        distinct_values, counts = numpy.unique(values, return_counts=True)
+        return dict(izip(distinct_values.tolist(), counts.tolist()))
+
+    def top(self, k):
+        """ Return the k highest scored answers as [score, answer_id] pairs, in descending order.
+
+        Ties on the score are broken by the answer id, as in aggregation.TopK.
+        """
+        numpy = numpy_module()
+        if numpy is None:
+            return [list(pair) for pair in heapq.nlargest(k, izip(self.score, self.answer_id))]
+        scores, answer_ids = self.column('score'), self.column('answer_id')
+        if len(scores) > k:
+            # Only the answers scored at least as the k-th highest one can be selected.
+            threshold = numpy.partition(scores, len(scores) - k)[len(scores) - k]
+            candidates = numpy.flatnonzero(scores >= threshold)
+            scores, answer_ids = scores[candidates], answer_ids[candidates]
+        order = numpy.lexsort((answer_ids, scores))[::-1][:k]
+        return numpy.column_stack((scores[order], answer_ids[order])).tolist()
@@ -8,12 +8,74 @@ This module contains the constants of the stackstatistics application package.
 ERROR_NO_ARGUMENTS = -1
 ERROR_DATE_ARGUMENTS_ORDER = -2
 ERROR_API_RESPONSE = -3
+ERROR_API_QUOTA = -4
 
 API_URI_SCHEME_AUTHORITY = "https://api.stackexchange.com"
 API_URI_ANSWERS_PATH = "/2.2/answers"
 API_URI_ANSWERS_COMMON_QUERY = "?order=desc&sort=votes&site=stackoverflow&pagesize=100"
 API_URI_ANSWERS_SINCE_QUERY = "&fromdate="
 API_URI_ANSWERS_UNTIL_QUERY = "&todate="
+API_URI_PAGE_QUERY = "&page="
 API_URI_COMMENTS_PATH = "/comments"
+API_URI_FILTERS_CREATE_PATH = "/2.2/filters/create"
+API_URI_FILTER_QUERY = "&filter="
+# The minimal filter returns only the fields the statistics, the local index and the pagination read, instead of
+# the owner, the dates and the body of every answer and comment. "default" is the filter of the API.
+DEFAULT_API_FILTER = "minimal"
+API_FILTER_FIELDS = ('.items', '.has_more', '.quota_max', '.quota_remaining', '.backoff',
+                     '.error_id', '.error_name', '.error_message',
+                     'answer.answer_id', 'answer.question_id', 'answer.score', 'answer.is_accepted',
+                     'answer.creation_date', 'comment.comment_id', 'comment.post_id', 'comment.creation_date')
 
 API_SUCCESS_CODE_RESPONSE = 200
+# Throttled or temporarily failing requests are retried, with jittered exponential backoff.
+API_RETRY_STATUS_CODES = (429, 502, 503)
+# The API reports throttle_violation (502) and temporarily_unavailable (503) errors with a 400 status code.
+API_RETRY_ERROR_IDS = (502, 503)
+API_MAX_REQUESTS_PER_SECOND = 30
+SCHEDULER_MAX_RETRIES = 4
+SCHEDULER_RETRY_BASE_SECONDS = 1.0
+
+# Paginated retrieval: the date/time range is split into sub-windows aligned to multiples of this
+# many seconds, which are paged through concurrently by a bounded pool of workers.
+API_WINDOW_SLICE_SECONDS = 3600
+DEFAULT_CONCURRENCY = 4
+# With many worker processes, the sub-windows are split into this many shards per worker, so that
+# the workers which finish early take over the remaining shards.
+SHARDS_PER_WORKER = 4
+DEFAULT_TRANSPORT = "sync"
+# The maximum number of ids the API accepts in a single vectorized request.
+API_MAX_IDS_PER_REQUEST = 100
+# The responses are read and parsed incrementally, in chunks of this many bytes.
+API_STREAM_CHUNK_SIZE = 16 * 1024
+
+# The number of highest scored answers whose comments are counted.
+TOP_ANSWERS = 10
+
+# On-disk response cache. Windows that closed more than CACHE_WINDOW_SETTLE_SECONDS ago rarely change,
+# so their pages are kept much longer than the pages of recent windows or of comments.
+DEFAULT_CACHE_DIRECTORY = "~/.cache/stackstatistics"
+CACHE_DATABASE_NAME = "responses.sqlite"
+PARTIALS_DATABASE_NAME = "aggregates.sqlite"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_WINDOW_SETTLE_SECONDS = 24 * 60 * 60
+CACHE_TTL_CLOSED_WINDOW = 30 * 24 * 60 * 60
+CACHE_TTL_OPEN_WINDOW = 5 * 60
+CACHE_TTL_COMMENTS = 60 * 60
+# The comment count of an answer stays fresh for this share of the age the answer had when counted, as old
+# answers rarely get new comments, within the time-to-lives of the pages of open and closed sub-windows.
+COMMENT_COUNTS_DATABASE_NAME = "comment_counts.sqlite"
+COMMENT_COUNT_TTL_AGE_SHARE = 0.05
+# The most ids looked up by a single SQLite query, below the default limit of 999 query parameters.
+SQLITE_MAX_VARIABLES = 500
+
+# The local index of `statistics ingest`, in the cache directory. The comments of the ingested answers
+# are retrieved for this many answers at a time, so that they are never all held in memory.
+INDEX_DATABASE_NAME = "index.sqlite"
+INGEST_COMMENTS_ANSWERS = 10000
+
+# The HTTP server of `statistics serve`. It keeps the aggregates of up to SERVE_MAX_WINDOWS sub-windows in
+# memory, dropping the least recently used ones first; the ones of recent sub-windows expire like their pages.
+SERVE_DEFAULT_HOST = "127.0.0.1"
+SERVE_DEFAULT_PORT = 8090
+SERVE_MAX_WINDOWS = 31 * 24
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local, persistent index of the answer and comment data, for offline analysis.
+"""
+import os
+import time
+import sqlite3
+import threading
+
+import constants
+from aggregation import ScoreHistogram, StatisticsAggregator
+
+
+class AnswerIndex(object):
+    """ Stores the answers and comments retrieved from the API in a SQLite database.
+
+    The answers are indexed by creation_date and question_id and the comments by post_id, so that
+    the statistics of any date/time range within the ingested ones are computed with SQL aggregates,
+    without any API request. The ingested date/time ranges are recorded as well.
+
+    :param (str) directory: The directory of the index database, created if missing.
+    """
+    def __init__(self, directory):
+        """ Return an AnswerIndex object whose database lives in directory. """
+        directory = os.path.expanduser(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(directory, constants.INDEX_DATABASE_NAME),
+                                           check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS answers ('
+                                     'answer_id INTEGER PRIMARY KEY, question_id INTEGER NOT NULL, '
+                                     'score INTEGER NOT NULL, is_accepted INTEGER NOT NULL, '
+                                     'creation_date INTEGER NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS answers_creation_date ON answers (creation_date)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS answers_question_id ON answers (question_id)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS comments ('
+                                     'comment_id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL, creation_date INTEGER)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS comments_post_id ON comments (post_id)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS ingested ('
+                                     'fromdate INTEGER NOT NULL, todate INTEGER NOT NULL, '
+                                     'PRIMARY KEY (fromdate, todate))')
+
+    def add_answers(self, items):
+        """ Store answer items, replacing the stored ones with the same ids, and return their number.
+
+        :param items: An iterable of answer items, as returned by the API.
+        """
+        rows = [(item['answer_id'], item['question_id'], item['score'], item['is_accepted'], item['creation_date'])
+                for item in items]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def add_comments(self, items):
+        """ Store comment items, replacing the stored ones with the same ids, and return their number.
+
+        :param items: An iterable of comment items, as returned by the API.
+        """
+        rows = [(item['comment_id'], item['post_id'], item.get('creation_date')) for item in items]
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO comments VALUES (?, ?, ?)', rows)
+        return len(rows)
+
+    def add_range(self, since, until):
+        """ Record that the answers of a date/time range, and their comments, have been stored. """
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO ingested VALUES (?, ?)',
+                                     (_timestamp(since), _timestamp(until)))
+
+    def covers(self, since, until):
+        """ Return whether a date/time range lies within the union of the ingested date/time ranges. """
+        covered_until = _timestamp(since) - 1
+        with self._lock:
+            for fromdate, todate in self._connection.execute('SELECT fromdate, todate FROM ingested '
+                                                             'ORDER BY fromdate'):
+                if fromdate > covered_until + 1:
+                    break
+                covered_until = max(covered_until, todate)
+        return covered_until >= _timestamp(until)
+
+    def answer_ids(self, since, until):
+        """ Return the ids of the stored answers created within a date/time range, in ascending order. """
+        with self._lock:
+            return [row[0] for row in self._connection.execute(
+                'SELECT answer_id FROM answers WHERE creation_date BETWEEN ? AND ? ORDER BY answer_id',
+                (_timestamp(since), _timestamp(until)))]
+
+    def aggregate(self, since, until, top=constants.TOP_ANSWERS):
+        """ Return a StatisticsAggregator of the stored answers created within a date/time range.
+
+        The comments of its top highest scored answers are counted too.
+
+        :param (datetime) since: The start date/time.
+        :param (datetime) until: The end date/time, inclusive.
+        :param (int) top: The number of highest scored answers whose comments are counted.
+        """
+        date_range = (_timestamp(since), _timestamp(until))
+        aggregator = StatisticsAggregator(top)
+        with self._lock:
+            aggregator.answer_count, aggregator.accepted_score_sum = self._connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(CASE WHEN is_accepted THEN score END), 0) FROM answers '
+                'WHERE creation_date BETWEEN ? AND ?', date_range).fetchone()
+            aggregator.question_ids.update(row[0] for row in self._connection.execute(
+                'SELECT DISTINCT question_id FROM answers WHERE creation_date BETWEEN ? AND ?', date_range))
+            aggregator.accepted_scores = ScoreHistogram(self._connection.execute(
+                'SELECT score, COUNT(*) FROM answers WHERE creation_date BETWEEN ? AND ? AND is_accepted '
+                'GROUP BY score', date_range).fetchall())
+            for score, answer_id, comment_count in self._connection.execute(
+                    'SELECT top_answers.score, top_answers.answer_id, COUNT(comments.comment_id) '
+                    'FROM (SELECT score, answer_id FROM answers WHERE creation_date BETWEEN ? AND ? '
+                    'ORDER BY score DESC, answer_id DESC LIMIT ?) AS top_answers '
+                    'LEFT JOIN comments ON comments.post_id = top_answers.answer_id '
+                    'GROUP BY top_answers.answer_id', date_range + (top,)):
+                aggregator.top_answers.push(score, answer_id)
+                aggregator.comments_per_answer[answer_id] = comment_count
+        return aggregator
+
+    def close(self):
+        """ Close the index database. """
+        with self._lock:
+            self._connection.close()
+
+
+def _timestamp(input_date):
+    """ Return the timestamp of a datetime, as the API dates are. """
+    return int(time.mktime(input_date.timetuple()))
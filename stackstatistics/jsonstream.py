@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental parsing of the StackExchange API responses, one item at a time.
+"""
+import re
+import json
+import codecs
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+class JSONPageStream(object):
+    """ Parses a StackExchange API response object from chunks of bytes, yielding the items of its 'items' array.
+
+    Only the item being parsed is kept in memory, along with the unparsed rest of the current chunk.
+    The other fields of the response (has_more, quota_remaining, backoff etc.) are collected in the
+    wrapper dictionary, which is complete once the iteration is over.
+
+    :param chunks: An iterable of byte strings, the UTF-8 encoded response body.
+    """
+    def __init__(self, chunks):
+        """ Return a JSONPageStream object reading from chunks. """
+        self.wrapper = dict()
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = u''
+        self._position = 0
+        self._exhausted = False
+
+    def __iter__(self):
+        """ Yield the items of the response one by one. """
+        self._expect(u'{')
+        if self._peek() == u'}':
+            self._position += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(u':')
+            if key == u'items':
+                for item in self._array():
+                    yield item
+            else:
+                self.wrapper[key] = self._value()
+            if self._expect(u',}') == u'}':
+                return
+
+    def _array(self):
+        """ Yield the values of the array at the current position. """
+        self._expect(u'[')
+        if self._peek() == u']':
+            self._position += 1
+            return
+        while True:
+            yield self._value()
+            if self._expect(u',]') == u']':
+                return
+
+    def _value(self):
+        """ Parse and return the JSON value at the current position, reading more chunks while it is incomplete. """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except ValueError:
+                if not self._read():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk.
+            if end < len(self._buffer) or self._exhausted:
+                self._position = end
+                return value
+            self._read()
+
+    def _expect(self, characters):
+        """ Consume and return the next non-whitespace character, which must be one of characters. """
+        character = self._peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of {0!r} at position {1}, found {2!r}'
+                             .format(characters, self._position, character))
+        self._position += 1
+        return character
+
+    def _peek(self):
+        """ Skip the whitespace and return the next character, or an empty string at the end of the stream. """
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer) or not self._read():
+                return self._buffer[self._position:self._position + 1]
+
+    def _read(self):
+        """ Append the next chunk to the buffer, dropping the parsed part. Return False at the end of the stream. """
+        if self._exhausted:
+            return False
+        try:
+            chunk = self._text_decoder.decode(next(self._chunks))
+        except StopIteration:
+            self._exhausted = True
+            chunk = self._text_decoder.decode(b'', final=True)
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
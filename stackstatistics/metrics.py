@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measurement of the phases, the API requests and the resources of an application run, and its profiling.
+"""
+import os
+import json
+import time
+import threading
+from array import array
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class RunMetrics(object):
+    """ Records the wall and CPU time of the phases of a run, and the latencies and downloads of its API requests.
+
+    A RunMetrics object is shared by the concurrent requests of a run. The times spent reading and
+    decoding the responses are summed over the threads, so they may add up to more than a phase lasts.
+    The metrics of worker processes are pickled and merged into the ones of the main process.
+    """
+    COUNTERS = ('bytes_downloaded', 'read_seconds', 'parse_seconds')
+
+    def __init__(self):
+        """ Return an empty RunMetrics object. """
+        self.phases = OrderedDict()
+        self.latencies = array('d')
+        self.counters = dict.fromkeys(RunMetrics.COUNTERS, 0)
+        self.api = dict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """ Pickle the metrics without their lock. """
+        return dict((name, value) for name, value in self.__dict__.items() if name != '_lock')
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def phase(self, name):
+        """ Return a context manager which adds the wall and CPU time of its block to the phase name. """
+        return _Phase(self, name)
+
+    def add_phase(self, name, wall_seconds, cpu_seconds):
+        """ Add wall and CPU seconds to a phase, created in the order the phases are first measured. """
+        with self._lock:
+            wall, cpu = self.phases.get(name, (0.0, 0.0))
+            self.phases[name] = (wall + wall_seconds, cpu + cpu_seconds)
+
+    def timed_request(self, request, url):
+        """ Send a request, recording its latency up to the response headers, and return the Response model.
+
+        :param request: A callable which requests a url, such as the get method of a transport.
+        :param (str) url: The url to request.
+        """
+        start = time.time()
+        response = request(url)
+        latency = time.time() - start
+        with self._lock:
+            self.latencies.append(latency)
+        return response
+
+    def timed_download(self, chunks):
+        """ Yield the chunks of a response body, counting their bytes and the seconds spent reading them. """
+        chunks = iter(chunks)
+        while True:
+            start = time.time()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                self._count(read_seconds=time.time() - start)
+                return
+            self._count(bytes_downloaded=len(chunk), read_seconds=time.time() - start)
+            yield chunk
+
+    def timed_parse(self, items):
+        """ Yield the items parsed from a response body, counting the seconds spent reading and parsing them. """
+        items = iter(items)
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                self._count(parse_seconds=time.time() - start)
+                return
+            self._count(parse_seconds=time.time() - start)
+            yield item
+
+    def merge(self, other):
+        """ Add the requests and downloads of another RunMetrics object, such as the one of a worker process. """
+        with self._lock:
+            self.latencies.extend(other.latencies)
+            for name in RunMetrics.COUNTERS:
+                self.counters[name] += other.counters[name]
+
+    def to_dict(self):
+        """ Return the metrics as a dictionary, ready to be serialized in JSON.
+
+        The latency percentiles are the nearest-rank ones. The CPU time and the peak resident memory size
+        of the worker processes are the ones of the workers that have exited, as reported by the operating
+        system, like the peak resident memory size of the process, in kilobytes on Linux.
+        """
+        with self._lock:
+            latencies = sorted(self.latencies)
+            metrics = OrderedDict()
+            metrics['phases'] = OrderedDict((name, OrderedDict([('wall_seconds', round(wall, 4)),
+                                                                ('cpu_seconds', round(cpu, 4))]))
+                                            for name, (wall, cpu) in self.phases.items())
+            metrics['api'] = OrderedDict(sorted(self.api.items()))
+            metrics['responses'] = len(latencies)
+            metrics['latency_p50_seconds'] = round(_percentile(latencies, 50), 4)
+            metrics['latency_p95_seconds'] = round(_percentile(latencies, 95), 4)
+            metrics['bytes_downloaded'] = self.counters['bytes_downloaded']
+            metrics['read_seconds'] = round(self.counters['read_seconds'], 4)
+            metrics['decode_seconds'] = round(max(self.counters['parse_seconds'] - self.counters['read_seconds'], 0),
+                                              4)
+        times = os.times()
+        metrics['workers_cpu_seconds'] = round(times[2] + times[3], 4)
+        if resource is not None:
+            metrics['peak_rss_kilobytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            metrics['workers_peak_rss_kilobytes'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return metrics
+
+    def write(self, stream):
+        """ Write the metrics to a stream, as a single line of JSON. """
+        stream.write(json.dumps(self.to_dict()))
+        stream.write('\n')
+
+    def _count(self, **amounts):
+        """ Add amounts to the counters. """
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+
+class _Phase(object):
+    """ Measures the wall and CPU time of a block, as a phase of a RunMetrics object. """
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = (time.time(), _cpu_time())
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_phase(self.name, time.time() - self._start[0], _cpu_time() - self._start[1])
+
+
+class Profiler(object):
+    """ Profiles the main thread of a run, along with the calls it dispatches to other threads.
+
+    Every thread gets its own cProfile profile, since a profile only follows the thread that enabled it.
+    The profiles are added together when dumped. The cProfile and pstats modules are imported only
+    when a run is profiled.
+    """
+    def __init__(self):
+        """ Return a Profiler object, which is not profiling yet. """
+        import cProfile
+        self._profile_class = cProfile.Profile
+        self._profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Start profiling the calling thread. """
+        self._local.active = True
+        self._thread_profile().enable()
+
+    def stop(self):
+        """ Stop profiling the calling thread. """
+        self._thread_profile().disable()
+        self._local.active = False
+
+    def wrap(self, function):
+        """ Return a function which calls function, profiling it in the calling thread. """
+        def profiled(*args):
+            if getattr(self._local, 'active', False):
+                return function(*args)
+            self._local.active = True
+            try:
+                return self._thread_profile().runcall(function, *args)
+            finally:
+                self._local.active = False
+        return profiled
+
+    def dump(self, path):
+        """ Write the statistics of all the profiles to path, in the format read by the pstats module. """
+        import pstats
+        with self._lock:
+            pstats.Stats(*self._profiles).dump_stats(path)
+
+    def _thread_profile(self):
+        """ Return the profile of the calling thread, created on first use. """
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = self._profile_class()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+
+def _cpu_time():
+    """ Return the user and system CPU seconds of the process, over all its threads. """
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _percentile(sorted_values, percent):
+    """ Return the nearest-rank percentile of a sorted list, or 0 for an empty list. """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(-(-len(sorted_values) * percent // 100) - 1, 0)]
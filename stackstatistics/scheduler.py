@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Scheduling of the StackExchange API requests, within the throttling limits of the API.
+"""
+import time
+import random
+import threading
+
+import constants
+
+
+class QuotaExceededError(Exception):
+    """ Raised instead of sending a request that would use more than the allowed share of the API quota. """
+    pass
+
+
+class RequestScheduler(object):
+    """ Schedules the requests of an application run, shared by all the concurrent requests.
+
+    Requests are paced to at most max_requests_per_second, delayed for the backoff seconds the
+    API asks for, and retried with jittered exponential backoff on 429/502/503 responses, on
+    throttle_violation and temporarily_unavailable API errors and on connection errors. No
+    request is sent once the remaining quota falls to the part of the quota that must be left
+    unused, i.e. (1 - quota_share) * quota_max.
+
+    :param (int) max_retries: The number of retries of a request, before giving up.
+    :param (float) quota_share: The share of the daily API quota the application may use, in (0, 1].
+    :param (float) max_requests_per_second: The maximum request rate.
+    :param (float) retry_base_seconds: The mean delay of the first retry, doubled on every next one.
+    """
+    def __init__(self, max_retries=constants.SCHEDULER_MAX_RETRIES, quota_share=1.0,
+                 max_requests_per_second=constants.API_MAX_REQUESTS_PER_SECOND,
+                 retry_base_seconds=constants.SCHEDULER_RETRY_BASE_SECONDS):
+        """ Return a RequestScheduler object. """
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.quota_share = quota_share
+        self.min_interval = 1.0 / max_requests_per_second
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+        self.quota_max = None
+        self.quota_remaining = None
+        self._next_request_at = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, request):
+        """ Send a request when the throttling allows it, retrying it if needed.
+
+        :param request: A callable without arguments, which sends the request and returns the Response model.
+        :returns: The Response model of the last attempt.
+        """
+        attempt = 0
+        while True:
+            self._wait_turn()
+            try:
+                response = request()
+            except IOError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if not RequestScheduler._is_retriable(response) or attempt >= self.max_retries:
+                    return response
+                response.close()
+            with self._lock:
+                self.retries += 1
+            self.delay(self.retry_base_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+
+    def observe(self, response_json):
+        """ Take into account the backoff and quota fields of a response.
+
+        :param (dict) response_json: The JSON object of a response, or its wrapper fields.
+        """
+        with self._lock:
+            if 'quota_remaining' in response_json:
+                self.quota_remaining = response_json['quota_remaining']
+                self.quota_max = response_json.get('quota_max', self.quota_max)
+        if response_json.get('backoff'):
+            self.delay(response_json['backoff'])
+
+    def observe_transfer(self, bytes_received, bytes_decoded):
+        """ Take into account the size of a response body, as received and as decoded.
+
+        :param (int) bytes_received: The bytes of the body received over the connection, compressed or not.
+        :param (int) bytes_decoded: The bytes of the decompressed body.
+        """
+        with self._lock:
+            self.bytes_received += bytes_received
+            self.bytes_decoded += bytes_decoded
+
+    def delay(self, seconds):
+        """ Send no request for the next seconds. """
+        with self._lock:
+            self._next_request_at = max(self._next_request_at, time.time() + seconds)
+
+    def stats(self):
+        """ Return a dictionary with the requests sent, the retries, the seconds spent throttled and the bytes
+        of the response bodies received and decoded.
+        """
+        with self._lock:
+            return {'requests': self.requests,
+                    'retries': self.retries,
+                    'throttled_seconds': round(self.throttled_seconds, 3),
+                    'bytes_received': self.bytes_received,
+                    'bytes_decoded': self.bytes_decoded,
+                    'quota_remaining': self.quota_remaining}
+
+    def merge_stats(self, stats):
+        """ Add the stats of another scheduler, such as the one of a worker process, to the stats of this one.
+
+        :param (dict) stats: The dictionary returned by the stats method of the other scheduler.
+        """
+        with self._lock:
+            self.requests += stats['requests']
+            self.retries += stats['retries']
+            self.throttled_seconds += stats['throttled_seconds']
+            self.bytes_received += stats['bytes_received']
+            self.bytes_decoded += stats['bytes_decoded']
+            if stats['quota_remaining'] is not None:
+                self.quota_remaining = min(stats['quota_remaining'], self.quota_remaining
+                                           if self.quota_remaining is not None else stats['quota_remaining'])
+
+    def _wait_turn(self):
+        """ Sleep until the next request may be sent, raising QuotaExceededError if none may be. """
+        with self._lock:
+            if self.quota_remaining is not None and self.quota_max is not None and \
+                    self.quota_remaining <= self.quota_max * (1 - self.quota_share):
+                raise QuotaExceededError('Only {0} of the {1} API quota remains, out of the {2:.0%} allowed to use'
+                                         .format(self.quota_remaining, self.quota_max, self.quota_share))
+            now = time.time()
+            send_at = max(now, self._next_request_at)
+            self._next_request_at = send_at + self.min_interval
+            self.requests += 1
+            self.throttled_seconds += send_at - now
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    @staticmethod
+    def _is_retriable(response):
+        """ Return whether the response is a temporary failure, worth retrying. """
+        if response.status_code in constants.API_RETRY_STATUS_CODES:
+            return True
+        if response.status_code == constants.API_SUCCESS_CODE_RESPONSE:
+            return False
+        try:
+            return response.json().get('error_id') in constants.API_RETRY_ERROR_IDS
+        except ValueError:
+            return False
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Long-running HTTP server of the statistics, which keeps the API connections, the response cache and
+the aggregates of the sub-windows warm from one query to the next.
+"""
+import time
+import logging
+import threading
+# Imported before the request threads call datetime.strptime, whose first concurrent calls fail on Python 2.
+import _strptime
+from argparse import ArgumentTypeError
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from collections import OrderedDict
+from urlparse import urlsplit, parse_qs
+
+import constants
+import validations
+from utils import APIRequest, APIResponseError, Item, PrintOption
+from aggregation import StatisticsAggregator
+from columnar import AnswerColumns
+from scheduler import QuotaExceededError
+
+CONTENT_TYPES = {'json': 'application/json', 'jsonl': 'application/x-ndjson', 'csv': 'text/csv',
+                 'html': 'text/html', 'tabular': 'text/plain'}
+
+
+class Coalescer(object):
+    """ Runs a single call per key at a time: the callers with the key of a call in progress wait for its result,
+    or its error, instead of making the same call again.
+    """
+    def __init__(self):
+        """ Return a Coalescer object without calls in progress. """
+        self._calls = dict()
+        self._lock = threading.Lock()
+
+    def call(self, key, function, *args):
+        """ Return function(*args), or the result of the call in progress with the same key. """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+        if not is_leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = function(*args)
+            except Exception as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class _Call(object):
+    """ A call of a Coalescer, with its result or error once done. """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class StatisticsService(object):
+    """ Computes the statistics of date/time ranges for the server, with a single APIRequest object.
+
+    The aggregates of the sub-windows are kept in memory, so that the overlapping date/time ranges of
+    later queries only retrieve the sub-windows not seen yet. Concurrent queries of the same date/time
+    range, and of the same sub-windows, are coalesced into a single retrieval.
+
+    :param (dict) options: A dictionary, the user input options of the API requests.
+    :param (int) max_windows: The maximum number of sub-window aggregates kept in memory.
+    """
+    def __init__(self, options, max_windows=constants.SERVE_MAX_WINDOWS):
+        """ Return a StatisticsService object. """
+        self.api_request = APIRequest(dict(options, since=None, until=None))
+        self.max_windows = max_windows
+        self._partials = OrderedDict()
+        self._lock = threading.Lock()
+        self._queries = Coalescer()
+        self._windows = Coalescer()
+
+    def statistics(self, since, until, top=constants.TOP_ANSWERS):
+        """ Return the result dictionary of a date/time range, as the statistics command computes it.
+
+        :param (datetime) since: The start date/time.
+        :param (datetime) until: The end date/time, inclusive.
+        :param (int) top: The number of highest scored answers whose comments are counted.
+        """
+        return self._queries.call((since, until, top), self._statistics, since, until, top)
+
+    def _statistics(self, since, until, top):
+        """ Merge the aggregates of the sub-windows of a date/time range and count the comments of its top answers. """
+        windows = self.api_request.windows([(since, until)])
+        aggregator = StatisticsAggregator(top)
+        creation_dates = dict()
+        for window, partial in zip(windows, self.api_request.map(
+                lambda window: self._windows.call((window, top), self._partial, window, top), windows)):
+            aggregator.merge(partial)
+            # The answers of a sub-window were created by its end, which bounds their age for the memo.
+            creation_dates.update((answer_id, window[1]) for answer_id in partial.top_answer_ids())
+
+        aggregator.comments_per_answer.update(self.api_request.count_comments(dict(
+            (answer_id, creation_dates[answer_id]) for answer_id in aggregator.top_answer_ids())))
+        return aggregator.result()
+
+    def _partial(self, window, top):
+        """ Return the aggregate of a sub-window, kept in memory or retrieved from the API. """
+        now = time.time()
+        with self._lock:
+            partial, expires_at = self._partials.pop(window, (None, 0))
+            if partial is not None and expires_at > now and partial.top >= top:
+                # Re-insert it, as the most recently used one.
+                self._partials[window] = (partial, expires_at)
+                return partial
+
+        partial = StatisticsAggregator(top).update_columns(AnswerColumns(self.api_request.iter_window_answers(window)))
+        # Shared by the threads of the queries which cover the sub-window.
+        partial.freeze()
+        if window[1] < now - constants.CACHE_WINDOW_SETTLE_SECONDS:
+            expires_at = float('inf')
+        else:
+            expires_at = now + constants.CACHE_TTL_OPEN_WINDOW
+        with self._lock:
+            self._partials[window] = (partial, expires_at)
+            while len(self._partials) > self.max_windows:
+                self._partials.popitem(last=False)
+        return partial
+
+    def close(self):
+        """ Release the connections and close the cache of the API requests. """
+        self.api_request.close()
+
+
+class StatisticsRequestHandler(BaseHTTPRequestHandler):
+    """ Serves GET /stats?since=...&until=...[&top=N][&format=FORMAT] with the statistics of the date/time range.
+
+    The dates have the "YYYY-MM-DD HH:MM:SS" format of the command line, and the formats are the ones
+    of --output-format, json by default.
+    """
+    def do_GET(self):
+        """ Respond with the statistics of the requested date/time range, or with a JSON error. """
+        url = urlsplit(self.path)
+        if url.path != '/stats':
+            self._send_error(404, 'Unknown path: {0}'.format(url.path))
+            return
+        query = dict((name, values[-1]) for name, values in parse_qs(url.query).items())
+        output_format = query.get('format', 'json').lower()
+        try:
+            since = validations.valid_date_is(query.get('since', ''))
+            until = validations.valid_date_is(query.get('until', ''))
+            top = validations.valid_positive_int(query.get('top', str(constants.TOP_ANSWERS)))
+        except ArgumentTypeError as error:
+            self._send_error(400, str(error))
+            return
+        if since > until:
+            self._send_error(400, 'since cannot be greater than until')
+            return
+        if output_format not in CONTENT_TYPES:
+            self._send_error(400, 'Invalid format: {0}'.format(output_format))
+            return
+
+        try:
+            result_dictionary = self.server.service.statistics(since, until, top)
+        except APIResponseError as error:
+            self._send_error(502, str(error))
+            return
+        except QuotaExceededError as error:
+            self._send_error(503, str(error))
+            return
+        except IOError as error:
+            # The API could not be reached, within the retries of the scheduler.
+            self._send_error(502, 'Unable to reach the API: {0}'.format(error))
+            return
+        except Exception as error:
+            # A long-running server answers every request, whatever went wrong.
+            logging.exception('Unable to compute the statistics of {0}'.format(self.path))
+            self._send_error(500, 'Internal error: {0}'.format(error))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[output_format])
+        self.end_headers()
+        _print_result(result_dictionary, since, until, output_format, self.wfile)
+
+    def log_message(self, message_format, *args):
+        """ Log the requests with the logging module, instead of the standard error. """
+        logging.info('{0} {1}'.format(self.client_address[0], message_format % args))
+
+    def _send_error(self, status_code, message):
+        """ Respond with a JSON error object. """
+        self.send_response(status_code)
+        self.send_header('Content-Type', CONTENT_TYPES['json'])
+        self.end_headers()
+        PrintOption({'error_message': message}, self.wfile).json()
+
+
+class StatisticsServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server of the statistics, which serves every request in a thread of its own.
+
+    :param (tuple) address: The (host, port) address to listen to; port 0 picks a free port.
+    :param (StatisticsService) service: The service which computes the statistics.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, service):
+        """ Return a StatisticsServer object listening to address. """
+        HTTPServer.__init__(self, address, StatisticsRequestHandler)
+        self.service = service
+
+    @property
+    def url(self):
+        """ The base url of the server. """
+        return 'http://{0}:{1}'.format(*self.server_address[:2])
+
+
+def _print_result(result_dictionary, since, until, output_format, stream):
+    """ Print a result dictionary to the stream, in the output format, like the statistics command.
+
+    The jsonl and csv records of a date/time range start with its since and until, as in batch mode.
+    """
+    if output_format in ('jsonl', 'csv'):
+        record = OrderedDict([('since', str(since)), ('until', str(until))])
+        record.update(sorted(result_dictionary.items()))
+        print_option = PrintOption(record, stream)
+        if output_format == 'csv':
+            print_option.csv()
+        else:
+            print_option.jsonl()
+        return
+
+    print_option = PrintOption(result_dictionary, stream)
+    number_of_comments_per_answer = result_dictionary['top_ten_answers_comment_count']
+    if output_format == 'json':
+        print_option.json()
+    elif output_format == 'html':
+        print_option.html(Item(answer_id, comment_count)
+                          for answer_id, comment_count in number_of_comments_per_answer.items())
+    else:
+        print_option.tabular(number_of_comments_per_answer.items())
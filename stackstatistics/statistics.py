@@ -4,121 +4,529 @@
 """
 The main functionality of the stackstatistics application.
 """
+import os
+import sys
+import time
 import logging
 from sys import argv
 from argparse import ArgumentParser
-from collections import defaultdict
+from collections import OrderedDict
+from datetime import timedelta
 
 import constants
 import validations
-from utils import APIRequest, Item, ResultDictionaryFactory, PrintOption
+from utils import APIRequest, APIResponseError, Item, PrintOption
+from cache import PartialStore
+from index import AnswerIndex
+from aggregation import StatisticsAggregator
+from columnar import AnswerColumns
+from metrics import Profiler, RunMetrics
+from scheduler import QuotaExceededError
 from __version__ import __version__
 
 
 def main():
     """ Entry point of stackstatistics package. Parses the user input as date/time range
     and retrieves/analyzes the StackOverflow answer and comment data for the
-    given date/time range.
+    given date/time range, or for many date/time ranges at once.
     """
     # Configure the logging level and format
     _logger_set_up()
 
+    if len(argv) > 1 and argv[1] == 'ingest':
+        ingest()
+        return
+    if len(argv) > 1 and argv[1] == 'serve':
+        serve()
+        return
+
     # Set up the parser
-    statistics_parser = ArgumentParser(description='Retrieve and analyze StackOverflow data.')
+    statistics_parser = ArgumentParser(description='Retrieve and analyze StackOverflow data. Run `statistics '
+                                                   'ingest -h` to store the data in a local index instead, '
+                                                   'or `statistics serve -h` to serve it over HTTP.')
     statistics_parser.add_argument("-V", "--version", action='version', version=('stackstatistics %s' % __version__))
     statistics_parser.add_argument("--since", metavar='"YYYY-MM-DD H:M:S"',
-                              help='specify the start date/time', required=True, type=validations.valid_date_is)
+                              help='specify the start date/time', type=validations.valid_date_is)
     statistics_parser.add_argument("--until", metavar='"YYYY-MM-DD H:M:S"',
-                              help='specify the end date/time', required=True, type=validations.valid_date_is)
-    statistics_parser.add_argument("--output-format", default='tabular', choices=['tabular', 'html', 'json'],
-                              type=str.lower, help='specify the output format')
+                              help='specify the end date/time', type=validations.valid_date_is)
+    batch_group = statistics_parser.add_mutually_exclusive_group()
+    batch_group.add_argument("--bucket", metavar='DURATION', type=validations.valid_duration,
+                             help='split the date/time range into windows of the given duration, e.g. 30m, 1h or '
+                                  '1d, and output the statistics of every window as a JSON line')
+    batch_group.add_argument("--windows", metavar='FILE', type=validations.valid_windows_file,
+                             help='specify a CSV file with a "since,until" date/time range per line, '
+                                  'and output the statistics of every range as a JSON line')
+    statistics_parser.add_argument("--output-format", default='tabular',
+                              choices=['tabular', 'html', 'json', 'jsonl', 'csv'], type=str.lower,
+                              help='specify the output format; jsonl and csv print a line or row at a time, '
+                                   'for large outputs')
+    statistics_parser.add_argument("--output-file", metavar='FILE',
+                              help='write the output to the given file, instead of the standard output')
+    statistics_parser.add_argument("--top", metavar='N', default=constants.TOP_ANSWERS,
+                              type=validations.valid_positive_int,
+                              help='specify the number of highest scored answers whose comments are counted')
+    statistics_parser.add_argument("--incremental", action='store_true',
+                              help='reuse the aggregates of the sub-windows computed by previous runs, once they '
+                                   'are more than a day old')
+    statistics_parser.add_argument("--workers", metavar='N', default=1, type=validations.valid_positive_int,
+                              help='specify the number of processes which retrieve and aggregate the answer data, '
+                                   'each with its own concurrent API requests and a share of the request rate')
+    statistics_parser.add_argument("--source", default='api', choices=['api', 'local'], type=str.lower,
+                              help='retrieve the data from the StackExchange API, or from the local index '
+                                   'built by `statistics ingest`')
+    statistics_parser.add_argument("--metrics", metavar='FILE', nargs='?', const='-',
+                              help='write the wall and CPU time of every phase, the API request latencies, the '
+                                   'bytes downloaded, the cache hits and the peak memory as a JSON line to the '
+                                   'given file, or to the standard error')
+    statistics_parser.add_argument("--profile", metavar='FILE',
+                              help='write a cProfile dump of the run to the given file, to be read with pstats; '
+                                   'the worker processes of --workers are not profiled')
+    _add_api_arguments(statistics_parser)
+    # Resolved once the batch mode is known.
+    statistics_parser.set_defaults(transport=None)
 
     if len(argv) > 1:
         # Put the given arguments in a dictionary
         options = vars(statistics_parser.parse_args(argv[1:]))
 
+        if options['windows']:
+            date_ranges = options['windows']
+        elif options['since'] is None or options['until'] is None:
+            statistics_parser.error('the --since and --until arguments are required, unless --windows is given')
+        else:
+            date_ranges = [(options['since'], options['until'])]
+
         # validate date arguments order
-        if options['since'] > options['until']:
+        if any(since > until for since, until in date_ranges):
             logging.error('--since argument date/time cannot be greater than --until\'s')
             exit(constants.ERROR_DATE_ARGUMENTS_ORDER)
 
-        # Create an APIRequest object to retrieve data from the StackExchange API
-        api_request_object = APIRequest(options)
-
-        logging.info('Retrieving answer data...')
-        answers_api_response = api_request_object.retrieve_answers()
-        # Get the retrieved json object
-        answers_api_response_json = answers_api_response.json()
-        # API Response Error Handling
-        _verify_api_response(answers_api_response.status_code, answers_api_response_json)
+        if options['transport'] is None:
+            # The many requests of a batch run share the keep-alive connections of one session.
+            options['transport'] = 'async' if options['windows'] or options['bucket'] else constants.DEFAULT_TRANSPORT
 
-        answer_json_items = answers_api_response_json['items']
-        # Retrieve all the answer IDs
-        answer_ids_list = list(map(lambda selected_item: selected_item['answer_id'], answer_json_items))
+        if options['bucket']:
+            date_ranges = [(since, min(since + options['bucket'] - timedelta(seconds=1), options['until']))
+                           for since in _date_range(options['since'], options['until'], options['bucket'])]
 
-        # Retrieve the score of each accepted answer in a list
-        accepted_answers_score_list = [item['score'] for item in answer_json_items if item['is_accepted']]
+        # Open the output files before the data is retrieved, so that an invalid path fails at once.
+        output_stream = _open_stream(statistics_parser, options['output_file'], sys.stdout, atomic=True)
+        metrics_stream = None
+        if options['metrics']:
+            metrics_stream = _open_stream(statistics_parser, options['metrics'] if options['metrics'] != '-' else None,
+                                          sys.stderr)
 
-        # Retrieve the number of answers per question
-        number_of_answers_per_question = defaultdict(int)  # default value of int is 0
-        for item in answer_json_items:
-            number_of_answers_per_question[item['question_id']] += 1
+        metrics = RunMetrics()
+        profiler = Profiler() if options['profile'] else None
+        if profiler is not None:
+            profiler.start()
+        succeeded = False
+        try:
+            if options['source'] == 'local':
+                with metrics.phase('query'):
+                    aggregators = _query_index(options, date_ranges)
+            else:
+                aggregators = _retrieve_aggregators(options, date_ranges, metrics, profiler)
 
-        logging.info('Retrieving comment data...')
-        comments_api_response = api_request_object.retrieve_comments(answer_ids_list)
-        # Get the retrieved json object
-        comments_api_response_json = comments_api_response.json()
-        # API Response Error Handling
-        _verify_api_response(comments_api_response.status_code, comments_api_response_json)
-
-        # Find the number of comments for each of the 10 answers with the highest score.
-        top_ten_answers = set(answer_ids_list[:10])  # lookup in a set is faster
-        number_of_comments_per_answer = dict(zip(answer_ids_list[:10], [0] * 10))
-
-        for comments in comments_api_response_json['items']:
-            if comments['post_id'] in top_ten_answers:
-                number_of_comments_per_answer[comments['post_id']] += 1
-
-        # Pack the results into a dictionary.
-        result_dictionary = ResultDictionaryFactory().create(
-            accepted_answers_score_list, number_of_answers_per_question.values(), number_of_comments_per_answer)
-
-        # Create an instance of the PrintOption class.
-        print_option = PrintOption(result_dictionary)
-
-        if options['output_format'] == 'json':
-            print_option.json()
-        elif options['output_format'] == 'html':
-            # Create an array of Item instances to insert into the html function.
-            comments_per_answer_items = [Item(answer_id, comment_count)
-                                         for answer_id, comment_count in number_of_comments_per_answer.items()]
-            print_option.html(comments_per_answer_items)
-        else:
-            # Create an array of tuples to insert into the tabular function.
-            comments_per_answer = [(answer_id, comment_count)
-                                   for answer_id, comment_count in number_of_comments_per_answer.items()]
-            print_option.tabular(comments_per_answer)
+            with metrics.phase('output'):
+                _print_results(options, date_ranges, aggregators, output_stream)
+            succeeded = True
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                profiler.dump(options['profile'])
+            if output_stream is not sys.stdout:
+                _close_stream(output_stream, options['output_file'], succeeded)
+            # Written for the failed runs too, whose metrics help the most.
+            if metrics_stream is not None:
+                metrics.write(metrics_stream)
+                if metrics_stream is not sys.stderr:
+                    metrics_stream.close()
     else:
         logging.error('No arguments were given.')
         statistics_parser.parse_args(' -h'.split())
         exit(constants.ERROR_NO_ARGUMENTS)
 
 
+def ingest():
+    """ Entry point of the `statistics ingest` command. Retrieves the answer and comment data of the given
+    date/time range from the StackExchange API, and stores it in the local index, so that it can be
+    analyzed again and again with --source local, without any API request.
+    """
+    ingest_parser = ArgumentParser(prog='statistics ingest',
+                                   description='Store StackOverflow data in the local index.')
+    ingest_parser.add_argument("--since", metavar='"YYYY-MM-DD H:M:S"', required=True,
+                               help='specify the start date/time', type=validations.valid_date_is)
+    ingest_parser.add_argument("--until", metavar='"YYYY-MM-DD H:M:S"', required=True,
+                               help='specify the end date/time', type=validations.valid_date_is)
+    _add_api_arguments(ingest_parser)
+    options = vars(ingest_parser.parse_args(argv[2:]))
+
+    if options['since'] > options['until']:
+        logging.error('--since argument date/time cannot be greater than --until\'s')
+        exit(constants.ERROR_DATE_ARGUMENTS_ORDER)
+
+    api_request_object = APIRequest(options)
+    answer_index = AnswerIndex(options['cache_dir'])
+    try:
+        logging.info('Ingesting answer data...')
+        answer_count = sum(api_request_object.map(
+            lambda window: answer_index.add_answers(api_request_object.iter_window_answers(window)),
+            api_request_object.windows()))
+
+        logging.info('Ingesting comment data...')
+        comment_count = 0
+        answer_ids = answer_index.answer_ids(options['since'], options['until'])
+        for start in range(0, len(answer_ids), constants.INGEST_COMMENTS_ANSWERS):
+            comment_count += answer_index.add_comments(api_request_object.retrieve_all_comments(
+                answer_ids[start:start + constants.INGEST_COMMENTS_ANSWERS]))
+        answer_index.add_range(options['since'], options['until'])
+    except APIResponseError as error:
+        logging.error(error)
+        exit(constants.ERROR_API_RESPONSE)
+    except QuotaExceededError as error:
+        logging.error(error)
+        exit(constants.ERROR_API_QUOTA)
+    finally:
+        answer_index.close()
+        api_request_object.close()
+
+    logging.info('Indexed {0} answers and {1} comments'.format(answer_count, comment_count))
+    _log_transfer(api_request_object)
+
+
+def serve():
+    """ Entry point of the `statistics serve` command. Serves the statistics of any date/time range over HTTP,
+    from a long-running process which keeps the API connections, the response cache and the aggregates
+    of the sub-windows warm, until interrupted.
+    """
+    serve_parser = ArgumentParser(prog='statistics serve',
+                                  description='Serve StackOverflow statistics at GET /stats?since=...&until=...'
+                                              '[&top=N][&format=FORMAT].')
+    serve_parser.add_argument("--host", default=constants.SERVE_DEFAULT_HOST,
+                              help='specify the address to listen to')
+    serve_parser.add_argument("--port", metavar='PORT', default=constants.SERVE_DEFAULT_PORT, type=int,
+                              help='specify the port to listen to')
+    _add_api_arguments(serve_parser)
+    # Keep-alive connections are what a long-running process is for.
+    serve_parser.set_defaults(transport='async')
+    options = vars(serve_parser.parse_args(argv[2:]))
+
+    # Imported here, so that the other commands do not pay for the HTTP server.
+    from server import StatisticsServer, StatisticsService
+    service = StatisticsService(options)
+    try:
+        http_server = StatisticsServer((options['host'], options['port']), service)
+    except IOError as error:
+        service.close()
+        serve_parser.error("can't listen to {0}:{1}: {2}".format(options['host'], options['port'], error))
+    logging.info('Serving the statistics at {0}/stats'.format(http_server.url))
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        service.close()
+
+
+def _print_results(options, date_ranges, aggregators, output_stream):
+    """ Print the results of the date/time ranges to the output stream, in the selected output format.
+
+    Many date/time ranges, and the jsonl and csv output formats, are printed a date/time range at a time.
+    """
+    output_format = options['output_format']
+    if options['windows'] or options['bucket'] or output_format in ('jsonl', 'csv'):
+        for index, ((since, until), aggregator) in enumerate(zip(date_ranges, aggregators)):
+            record = OrderedDict([('since', str(since)), ('until', str(until))])
+            record.update(sorted(aggregator.result().items()))
+            print_option = PrintOption(record, output_stream)
+            if output_format == 'csv':
+                print_option.csv(header=index == 0)
+            elif output_format == 'html':
+                print_option.html(Item(answer_id, comment_count) for answer_id, comment_count
+                                  in record['top_ten_answers_comment_count'].items())
+            else:
+                # Output a JSON line per date/time range.
+                print_option.jsonl()
+        return
+
+    # Pack the results into a dictionary.
+    result_dictionary = aggregators[0].result()
+    number_of_comments_per_answer = result_dictionary['top_ten_answers_comment_count']
+
+    # Create an instance of the PrintOption class.
+    print_option = PrintOption(result_dictionary, output_stream)
+
+    if output_format == 'json':
+        print_option.json()
+    elif output_format == 'html':
+        # Create the Item instances to insert into the html function, as it prints them.
+        comments_per_answer_items = (Item(answer_id, comment_count)
+                                     for answer_id, comment_count in number_of_comments_per_answer.items())
+        print_option.html(comments_per_answer_items)
+    else:
+        # Create an array of tuples to insert into the tabular function.
+        comments_per_answer = [(answer_id, comment_count)
+                               for answer_id, comment_count in number_of_comments_per_answer.items()]
+        print_option.tabular(comments_per_answer)
+
+
+def _retrieve_aggregators(options, date_ranges, metrics=None, profiler=None):
+    """ Retrieve the answer and comment data of the date/time ranges from the StackExchange API, and return
+    a StatisticsAggregator per date/time range.
+
+    The phases of the run are measured in metrics, and its API requests too if options['metrics'] is set.
+    The threads of the requests are profiled by profiler, if given.
+    """
+    metrics = metrics or RunMetrics()
+    options = dict(options, since=min(since for since, _ in date_ranges), until=max(until for _, until in date_ranges))
+    # The worker processes are started before any connection, thread or database of this process exists.
+    pool = None
+    if options.get('workers', 1) > 1:
+        from multiprocessing import Pool
+        pool = Pool(options['workers'])
+
+    # Create an APIRequest object to retrieve data from the StackExchange API, for all the date ranges at once.
+    api_request_object = APIRequest(options)
+    if options.get('metrics'):
+        api_request_object.metrics = metrics
+    api_request_object.profiler = profiler
+
+    partial_store = None
+    if options['incremental']:
+        if api_request_object.cache is None:
+            logging.warning('--incremental needs the response cache, it is ignored along with --no-cache')
+        else:
+            partial_store = PartialStore(options['cache_dir'])
+
+    try:
+        logging.info('Retrieving answer data...')
+        with metrics.phase('answers'):
+            windows = api_request_object.windows(date_ranges)
+            partials = _retrieve_partials(api_request_object, windows, options['top'], partial_store, pool, options)
+            aggregators = []
+            for range_windows in APIRequest.windows_within(date_ranges, windows):
+                aggregator = StatisticsAggregator(options['top'])
+                for window in range_windows:
+                    aggregator.merge(partials[window])
+                aggregators.append(aggregator)
+
+        # Find the number of comments for each of the answers with the highest score.
+        logging.info('Retrieving comment data...')
+        with metrics.phase('comments'):
+            _count_comments(api_request_object, partials, aggregators)
+
+        if partial_store is not None:
+            # Only the partials of settled sub-windows are worth reusing: the answers of the last day still change.
+            settled_before = time.time() - constants.CACHE_WINDOW_SETTLE_SECONDS
+            partial_store.save(dict((window, partial) for window, partial in partials.items()
+                                    if window[1] < settled_before))
+    except APIResponseError as error:
+        logging.error(error)
+        exit(constants.ERROR_API_RESPONSE)
+    except QuotaExceededError as error:
+        logging.error(error)
+        exit(constants.ERROR_API_QUOTA)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if partial_store is not None:
+            partial_store.close()
+        # Recorded for the failed runs too.
+        metrics.api.update(api_request_object.scheduler.stats())
+        if api_request_object.cache is not None:
+            metrics.api.update(cache_hits=api_request_object.cache.hits, cache_misses=api_request_object.cache.misses)
+
+    if api_request_object.cache is not None:
+        logging.info('Response cache hits: {0}, misses: {1}'
+                     .format(api_request_object.cache.hits, api_request_object.cache.misses))
+    logging.info('API requests: {requests}, retries: {retries}, throttled for: {throttled_seconds}s, '
+                 'remaining quota: {quota_remaining}'.format(**metrics.api))
+    _log_transfer(api_request_object)
+    api_request_object.close()
+    return aggregators
+
+
+def _query_index(options, date_ranges):
+    """ Return a StatisticsAggregator per date/time range, computed from the local index, without any API request. """
+    answer_index = AnswerIndex(options['cache_dir'])
+    try:
+        for since, until in date_ranges:
+            if not answer_index.covers(since, until):
+                logging.warning('The date/time range {0} - {1} has not been ingested as a whole, '
+                                'run `statistics ingest` for it first'.format(since, until))
+        return [answer_index.aggregate(since, until, options['top']) for since, until in date_ranges]
+    finally:
+        answer_index.close()
+
+
+def _add_api_arguments(parser):
+    """ Add the arguments of the StackExchange API requests to an argument parser. """
+    parser.add_argument("--concurrency", metavar='N', default=constants.DEFAULT_CONCURRENCY,
+                        type=validations.valid_positive_int,
+                        help='specify the number of concurrent API requests')
+    parser.add_argument("--transport", default=constants.DEFAULT_TRANSPORT, choices=['sync', 'async'],
+                        type=str.lower,
+                        help='specify the HTTP transport: blocking requests on new connections (sync), '
+                             'or non-blocking requests over a keep-alive connection pool (async)')
+    parser.add_argument("--max-retries", metavar='N', default=constants.SCHEDULER_MAX_RETRIES,
+                        type=validations.valid_non_negative_int,
+                        help='specify the number of retries of throttled or failed API requests')
+    parser.add_argument("--quota-share", metavar='SHARE', default=1.0, type=validations.valid_share,
+                        help='specify the share of the daily API quota which may be used, in the (0, 1] range')
+    parser.add_argument("--max-requests-per-second", metavar='RATE',
+                        default=constants.API_MAX_REQUESTS_PER_SECOND, type=validations.valid_positive_number,
+                        help='specify the maximum API request rate; the StackExchange API allows up to 30')
+    parser.add_argument("--cache-dir", metavar='DIRECTORY', default=constants.DEFAULT_CACHE_DIRECTORY,
+                        help='specify the directory of the API response cache and of the local index')
+    parser.add_argument("--no-cache", action='store_true',
+                        help='disable the API response cache')
+    parser.add_argument("--api-url", metavar='URL', default=constants.API_URI_SCHEME_AUTHORITY,
+                        help='specify the scheme and authority of the StackExchange API')
+    parser.add_argument("--api-filter", metavar='FILTER', default=constants.DEFAULT_API_FILTER,
+                        help='specify the filter of the API requests: minimal, to return only the fields that '
+                             'are read, default, or the id of a filter created with the API')
+
+
+def _retrieve_partials(api_request_object, windows, top, partial_store=None, pool=None, options=None):
+    """ Return the aggregators of the given sub-windows, keyed by sub-window.
+
+    The stored aggregators that select at least top answers are reused, and only the remaining
+    sub-windows are retrieved from the API: by the threads of api_request_object, or by the worker
+    processes of pool, in shards of contiguous sub-windows, if a pool is given along with the options.
+    """
+    partials = dict()
+    if partial_store is not None:
+        partials = dict((window, partial) for window, partial in partial_store.load(windows).items()
+                        if partial.top >= top)
+    if partials:
+        logging.info('Reusing the stored aggregates of {0} out of {1} sub-windows'.format(len(partials), len(windows)))
+    missing_windows = [window for window in windows if window not in partials]
+    if pool is None:
+        partials.update(zip(missing_windows, api_request_object.map(
+            lambda window: _aggregate(api_request_object.iter_window_answers(window), top), missing_windows)))
+        return partials
+
+    # Every worker gets a share of the request rate, so that together they keep within the rate limit.
+    request_rate = options.get('max_requests_per_second') or constants.API_MAX_REQUESTS_PER_SECOND
+    # The filter is created once, by this process.
+    worker_options = dict(options, max_requests_per_second=request_rate / float(options['workers']),
+                          api_filter=api_request_object.resolve_filter())
+    shard_count = min(len(missing_windows), options['workers'] * constants.SHARDS_PER_WORKER) or 1
+    shard_size = -(-len(missing_windows) // shard_count)
+    shards = [(worker_options, missing_windows[start:start + shard_size], top)
+              for start in range(0, len(missing_windows), shard_size)]
+    for shard_partials, scheduler_stats, cache_stats, shard_metrics in pool.imap_unordered(_aggregate_shard, shards):
+        partials.update(shard_partials)
+        api_request_object.scheduler.merge_stats(scheduler_stats)
+        if shard_metrics is not None and api_request_object.metrics is not None:
+            api_request_object.metrics.merge(shard_metrics)
+        if api_request_object.cache is not None:
+            api_request_object.cache.hits += cache_stats[0]
+            api_request_object.cache.misses += cache_stats[1]
+    return partials
+
+
+def _aggregate_shard(shard):
+    """ Retrieve and aggregate a shard of sub-windows in a worker process.
+
+    :param (tuple) shard: An (options, windows, top) tuple.
+    :returns: A tuple with the aggregators of the sub-windows, keyed by sub-window, the stats of the
+              scheduler, the (hits, misses) of the response cache and the RunMetrics of the requests
+              of the worker, or None if options['metrics'] is not set.
+    """
+    options, windows, top = shard
+    api_request_object = APIRequest(options)
+    if options.get('metrics'):
+        api_request_object.metrics = RunMetrics()
+    try:
+        partials = dict(zip(windows, api_request_object.map(
+            lambda window: _aggregate(api_request_object.iter_window_answers(window), top), windows)))
+        cache = api_request_object.cache
+        return (partials, api_request_object.scheduler.stats(),
+                (cache.hits, cache.misses) if cache is not None else (0, 0), api_request_object.metrics)
+    finally:
+        api_request_object.close()
+
+
+def _aggregate(answer_items, top):
+    """ Return a StatisticsAggregator updated with every answer item.
+
+    The answers are loaded into an AnswerColumns store, whose statistics are computed at once.
+    """
+    return StatisticsAggregator(top).update_columns(AnswerColumns(answer_items))
+
+
+def _count_comments(api_request_object, partials, aggregators):
+    """ Count the comments of the highest scored answers of the merged aggregators.
+
+    The counts are looked up at once, retrieving from the API only the ones the comment count memo
+    lacks or holds for too long. The counts of stored partials are not reused, since the memo decides
+    how long a count stays fresh.
+    """
+    # The answers of a sub-window were created by its end, which bounds their age for the memo.
+    creation_dates = dict((answer_id, window[1]) for window, partial in partials.items()
+                          for answer_id in partial.top_answer_ids())
+    now = time.time()
+    counts = api_request_object.count_comments(dict(
+        (answer_id, creation_dates.get(answer_id, now)) for aggregator in aggregators
+        for answer_id in aggregator.top_answer_ids()))
+
+    for aggregator in aggregators:
+        aggregator.comments_per_answer = dict((answer_id, counts[answer_id])
+                                              for answer_id in aggregator.top_answer_ids())
+
+
+def _log_transfer(api_request_object):
+    """ Log the bytes of the API responses received over the network and decoded, with the filter of the requests. """
+    stats = api_request_object.scheduler.stats()
+    logging.info('API responses with the {0} filter: {1} bytes received, {2} bytes decoded, {3} bytes saved by '
+                 'compression'.format(api_request_object.api_filter, stats['bytes_received'], stats['bytes_decoded'],
+                                      stats['bytes_decoded'] - stats['bytes_received']))
+
+
+def _open_stream(parser, path, default, atomic=False):
+    """ Open path for writing, or return the default stream if no path is given. An unwritable path is a usage error.
+
+    An atomic stream writes to a temporary file next to path, which _close_stream moves to path only
+    once the run has succeeded, so that a failed run leaves the previous file in place.
+
+    :param (ArgumentParser) parser: The parser which reports the error.
+    """
+    if not path:
+        return default
+    try:
+        return open('{0}.{1}.tmp'.format(path, os.getpid()) if atomic else path, 'wb')
+    except IOError as error:
+        parser.error("can't open the output file: {0}".format(error))
+
+
+def _close_stream(stream, path, succeeded):
+    """ Close a stream opened by _open_stream for path, moving its temporary file to path if it is an atomic one
+    and the run succeeded, or removing it otherwise.
+    """
+    stream.close()
+    if stream.name != path:
+        if succeeded:
+            os.rename(stream.name, path)
+        else:
+            os.remove(stream.name)
+
+
+def _date_range(since, until, step):
+    """ Yield the date/times from since to until, inclusive, every step. """
+    while since <= until:
+        yield since
+        since += step
+
+
 def _logger_set_up(level=logging.INFO):
     """ Logger set-up. Default level is INFO. """
     logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s',
                         level=level, datefmt='%Y-%m-%d %H:%M:%S')
 
 
-def _verify_api_response(status_code, api_response_json):
-    """ Verify that the response has retrieved successfully, else exit the application. """
-    if status_code is not constants.API_SUCCESS_CODE_RESPONSE:
-        logging.error('Status code: {0}. Reason: {1}: {2}'
-                      .format(status_code,
-                              api_response_json['error_message'],
-                              api_response_json['error_name']))
-        exit(constants.ERROR_API_RESPONSE)
-
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP transport backends of the StackExchange API requests. The requests package and the worker
+pools are imported when a transport first needs them, to keep the start-up of the application fast.
+"""
+
+
+class SyncTransport(object):
+    """ Blocking requests, each one on a new connection, fanned out to a worker pool created per call.
+
+    :param (int) concurrency: The maximum number of requests in flight.
+    """
+    def __init__(self, concurrency):
+        """ Return a SyncTransport object with the given concurrency. """
+        self.concurrency = concurrency
+
+    def get(self, url):
+        """ Request the url and return the Response model, with its body not read yet. """
+        import requests
+        return requests.get(url, stream=True)
+
+    def map(self, function, iterable):
+        """ Apply function to every element of iterable on a bounded pool of worker threads. """
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(self.concurrency)
+        try:
+            return pool.map(function, iterable)
+        finally:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        """ Release the resources of the transport. """
+        pass
+
+
+class AsyncTransport(object):
+    """ Non-blocking requests over a single pool of keep-alive connections.
+
+    The requests are dispatched to a long-lived pool of workers, so that the caller is never blocked
+    by a single request and hundreds of page and comment requests overlap. They share one session,
+    whose connection pool is limited to concurrency connections, reused across all the requests,
+    without a new TCP and TLS handshake each.
+
+    :param (int) concurrency: The maximum number of requests in flight, and of open connections.
+    """
+    def __init__(self, concurrency):
+        """ Return an AsyncTransport object with the given concurrency. """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from multiprocessing.pool import ThreadPool
+        self.concurrency = concurrency
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._pool = ThreadPool(concurrency)
+
+    def get(self, url):
+        """ Request the url and return the Response model, with its body not read yet. """
+        return self._session.get(url, stream=True)
+
+    def submit(self, function, *args):
+        """ Schedule function(*args) and return at once an AsyncResult, whose get method waits for its result. """
+        return self._pool.apply_async(function, args)
+
+    def map(self, function, iterable):
+        """ Schedule function for every element of iterable at once and return the results, in order. """
+        return [result.get() for result in [self.submit(function, element) for element in iterable]]
+
+    def close(self):
+        """ Stop the workers and close the connections. """
+        self._pool.close()
+        self._pool.join()
+        self._session.close()
+
+
+TRANSPORTS = {'sync': SyncTransport, 'async': AsyncTransport}
@@ -5,14 +5,40 @@
 Includes all the utilities for the application.
 """
 
-import requests
+import csv
+import sys
 import time
 import json
-
-from tabulate import tabulate
-from flask_table import Table, Col
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from urllib import quote
 
 import constants
+from cache import CommentCountMemo, ResponseCache
+from jsonstream import JSONPageStream
+from transport import TRANSPORTS
+from scheduler import RequestScheduler
+
+
+class APIResponseError(Exception):
+    """ Raised when the StackExchange API does not respond successfully.
+
+    :param (int) status_code: The HTTP status code of the response.
+    :param (dict) response_json: The (error) JSON object of the response.
+    """
+    def __init__(self, status_code, response_json):
+        """ Return an APIResponseError for the given status code and error JSON object. """
+        self.status_code = status_code
+        self.error_name = response_json.get('error_name')
+        self.error_message = response_json.get('error_message')
+        super(APIResponseError, self).__init__('Status code: {0}. Reason: {1}: {2}'
+                                               .format(status_code, self.error_message, self.error_name))
+
+    def __reduce__(self):
+        """ Support pickling, to raise the errors of worker processes in the main process. """
+        return APIResponseError, (self.status_code, {'error_name': self.error_name,
+                                                     'error_message': self.error_message})
 
 
 class APIRequest(object):
@@ -24,31 +50,313 @@ class APIRequest(object):
         """ Return an APIRequest object with the date/time range specified. """
         self.since = options['since']
         self.until = options['until']
+        self.api_url = options.get('api_url') or constants.API_URI_SCHEME_AUTHORITY
+        self.concurrency = options.get('concurrency') or constants.DEFAULT_CONCURRENCY
+        self.slice_seconds = options.get('slice_seconds') or constants.API_WINDOW_SLICE_SECONDS
+        self.transport = TRANSPORTS[options.get('transport') or constants.DEFAULT_TRANSPORT](self.concurrency)
+        self.scheduler = RequestScheduler(options.get('max_retries', constants.SCHEDULER_MAX_RETRIES),
+                                          options.get('quota_share') or 1.0,
+                                          options.get('max_requests_per_second') or
+                                          constants.API_MAX_REQUESTS_PER_SECOND)
+        self.cache = None
+        if options.get('cache_dir') and not options.get('no_cache'):
+            self.cache = ResponseCache(options['cache_dir'])
+        # The comment counts are remembered across runs along with the responses, or within the run only.
+        self.comment_counts = CommentCountMemo(options['cache_dir'] if self.cache is not None else None)
+        # An optional RunMetrics object, which records the requests, and an optional Profiler of the threads.
+        self.metrics = None
+        self.profiler = None
+        self.api_filter = options.get('api_filter') or constants.DEFAULT_API_FILTER
+        self._filter_lock = threading.Lock()
+        self._warned_uncompressed = False
 
     def retrieve_answers(self):
         """ Request to retrieve answers from the corresponding api endpoint. """
-        return requests.get('{0}{1}{2}{3}{4}{5}{6}'
-                            .format(constants.API_URI_SCHEME_AUTHORITY,
-                                    constants.API_URI_ANSWERS_PATH,
-                                    constants.API_URI_ANSWERS_COMMON_QUERY,
-                                    constants.API_URI_ANSWERS_SINCE_QUERY,
-                                    APIRequest._datetime_to_timestamp(self.since),
-                                    constants.API_URI_ANSWERS_UNTIL_QUERY,
-                                    APIRequest._datetime_to_timestamp(self.until)))
+        return self._send('{0}{1}{2}{3}{4}{5}{6}{7}'
+                          .format(self.api_url,
+                                  constants.API_URI_ANSWERS_PATH,
+                                  constants.API_URI_ANSWERS_COMMON_QUERY,
+                                  constants.API_URI_ANSWERS_SINCE_QUERY,
+                                  APIRequest._datetime_to_timestamp(self.since),
+                                  constants.API_URI_ANSWERS_UNTIL_QUERY,
+                                  APIRequest._datetime_to_timestamp(self.until),
+                                  self._filter_query()))
+
+    def retrieve_all_answers(self):
+        """ Retrieve every answer of the date/time range, following the API pagination.
+
+        The range is split into sub-windows which are paged through concurrently. The items
+        are deduplicated by answer id and ordered by score, as with order=desc&sort=votes.
+
+        :returns: A list with the answer items.
+        """
+        answers = dict()
+        for window_items in self.map(self.retrieve_window_answers, self.windows()):
+            for item in window_items:
+                answers[item['answer_id']] = item
+        return sorted(answers.values(), key=lambda item: (item['score'], item['answer_id']), reverse=True)
+
+    def windows(self, date_ranges=None):
+        """ Split the date/time range into sub-windows, aligned to multiples of slice_seconds.
+
+        Aligned sub-windows are shared by overlapping date/time ranges, so their results can be reused.
+        When many date/time ranges are given, their union is split instead, at their boundaries too,
+        so that every range is covered by whole sub-windows.
+
+        :param (list) date_ranges: An optional list of (since, until) datetime tuples, within the date/time range.
+        :returns: A list of (fromdate, todate) timestamp tuples, both ends inclusive.
+        """
+        ranges = [(APIRequest._datetime_to_timestamp(since), APIRequest._datetime_to_timestamp(until))
+                  for since, until in date_ranges or [(self.since, self.until)]]
+        boundaries = set()
+        for since, until in ranges:
+            boundaries.update([since, until + 1])
+            boundaries.update(range(since - since % self.slice_seconds + self.slice_seconds,
+                                    until + 1, self.slice_seconds))
+        boundaries = sorted(boundaries)
+        # Split at every boundary, a sub-window lies within a range as soon as its start does, so only
+        # its start is looked up, by bisection, in the sorted union of the ranges.
+        union = []
+        for since, until in sorted(ranges):
+            if union and since <= union[-1][1] + 1:
+                union[-1][1] = max(union[-1][1], until)
+            else:
+                union.append([since, until])
+        union_starts = [since for since, _ in union]
+        windows = []
+        for start, end in zip(boundaries, boundaries[1:]):
+            index = bisect_right(union_starts, start) - 1
+            if index >= 0 and start <= union[index][1]:
+                windows.append((start, end - 1))
+        return windows
 
     @staticmethod
-    def retrieve_comments(answer_ids):
+    def windows_within(date_ranges, windows):
+        """ Return the sub-windows that lie within every date/time range, found by bisection.
+
+        :param (list) date_ranges: A list of (since, until) datetime tuples.
+        :param (list) windows: A sorted list of disjoint (fromdate, todate) timestamp tuples, as returned by windows.
+        :returns: A list with the sub-windows of every date/time range, in the order of the ranges.
+        """
+        starts = [window[0] for window in windows]
+        ends = [window[1] for window in windows]
+        return [windows[bisect_left(starts, APIRequest._datetime_to_timestamp(since)):
+                        bisect_right(ends, APIRequest._datetime_to_timestamp(until))]
+                for since, until in date_ranges]
+
+    def retrieve_comments(self, answer_ids):
         """ Request to retrieve the comments for the specified answer ids.
 
         :param (list) answer_ids: An array with the selected answer ids.
         :returns: Response model.
         """
-        return requests.get('{0}{1}/{2}{3}{4}'
-                            .format(constants.API_URI_SCHEME_AUTHORITY,
-                                    constants.API_URI_ANSWERS_PATH,
-                                    ';'.join(str(answer_id) for answer_id in answer_ids),
-                                    constants.API_URI_COMMENTS_PATH,
-                                    constants.API_URI_ANSWERS_COMMON_QUERY))
+        return self._send(self._comments_url(answer_ids))
+
+    def retrieve_all_comments(self, answer_ids):
+        """ Retrieve every comment of the specified answer ids, following the API pagination.
+
+        The ids are requested in concurrent batches of at most API_MAX_IDS_PER_REQUEST ids.
+
+        :param (list) answer_ids: An array with the selected answer ids.
+        :returns: A list with the comment items.
+        """
+        answer_ids = list(answer_ids)
+        batches = [answer_ids[index:index + constants.API_MAX_IDS_PER_REQUEST]
+                   for index in range(0, len(answer_ids), constants.API_MAX_IDS_PER_REQUEST)]
+        return [item
+                for batch_items in self.map(
+                    lambda batch: self._retrieve_pages(self._comments_url(batch), constants.CACHE_TTL_COMMENTS),
+                    batches)
+                for item in batch_items]
+
+    def count_comments(self, creation_dates):
+        """ Return the number of comments of answers, retrieving only the counts that the memo lacks or that are stale.
+
+        The counts being retrieved by another thread for the same answers are waited for, instead of being
+        retrieved again.
+
+        :param (dict) creation_dates: The creation timestamps of the answers, or later ones if only a bound
+                                      is known, keyed by answer id. The older the answer, the longer its
+                                      count is remembered.
+        :returns: A dictionary with the number of comments, keyed by answer id.
+        """
+        counts, claimed, claimed_by_others = self.comment_counts.claim(creation_dates.keys())
+        new_counts = dict.fromkeys(claimed, 0)
+        try:
+            for comment in self.retrieve_all_comments(claimed):
+                if comment['post_id'] in new_counts:
+                    new_counts[comment['post_id']] += 1
+        except Exception:
+            self.comment_counts.release(claimed)
+            raise
+        self.comment_counts.put(new_counts, creation_dates)
+        counts.update(new_counts)
+
+        if claimed_by_others:
+            for event in claimed_by_others.values():
+                event.wait()
+            # Remembered by now, unless their retrieval failed, in which case they are retrieved here.
+            counts.update(self.count_comments(dict((answer_id, creation_dates[answer_id])
+                                                   for answer_id in claimed_by_others)))
+        return counts
+
+    def _comments_url(self, answer_ids):
+        """ Return the comments endpoint url of the specified answer ids. """
+        return '{0}{1}/{2}{3}{4}{5}'.format(self.api_url,
+                                            constants.API_URI_ANSWERS_PATH,
+                                            ';'.join(str(answer_id) for answer_id in answer_ids),
+                                            constants.API_URI_COMMENTS_PATH,
+                                            constants.API_URI_ANSWERS_COMMON_QUERY,
+                                            self._filter_query())
+
+    def resolve_filter(self):
+        """ Return the filter of the requests, "default" or a filter id, creating the minimal filter on first use.
+
+        The API returns the same id for the same fields, so the id is cached like the pages of closed
+        sub-windows. The default filter is used if the minimal one cannot be created.
+        """
+        with self._filter_lock:
+            if self.api_filter == 'minimal':
+                url = '{0}{1}?include={2}&base=none&unsafe=false'.format(
+                    self.api_url, constants.API_URI_FILTERS_CREATE_PATH,
+                    quote(';'.join(constants.API_FILTER_FIELDS), safe=''))
+                try:
+                    self.api_filter = self._retrieve_pages(url, constants.CACHE_TTL_CLOSED_WINDOW)[0]['filter']
+                except (APIResponseError, IndexError, KeyError) as error:
+                    logging.warning('The minimal API filter could not be created, the default one is used: {0}'
+                                    .format(error))
+                    self.api_filter = 'default'
+            return self.api_filter
+
+    def _filter_query(self):
+        """ Return the filter query parameter of the requests, empty for the default filter. """
+        api_filter = self.resolve_filter()
+        return '' if api_filter == 'default' else '{0}{1}'.format(constants.API_URI_FILTER_QUERY, quote(api_filter))
+
+    def retrieve_window_answers(self, window):
+        """ Retrieve every answer of a single sub-window, following the API pagination.
+
+        :param (tuple) window: A (fromdate, todate) timestamp tuple, both ends inclusive.
+        :returns: A list with the answer items.
+        """
+        return list(self.iter_window_answers(window))
+
+    def iter_window_answers(self, window):
+        """ Yield every answer of a single sub-window, following the API pagination.
+
+        The responses are parsed incrementally, so that only the current page is held in memory.
+        Answers repeated across pages, while the votes shift during the pagination, are skipped.
+
+        :param (tuple) window: A (fromdate, todate) timestamp tuple, both ends inclusive.
+        """
+        url = '{0}{1}{2}{3}{4}{5}{6}{7}'.format(self.api_url,
+                                                constants.API_URI_ANSWERS_PATH,
+                                                constants.API_URI_ANSWERS_COMMON_QUERY,
+                                                constants.API_URI_ANSWERS_SINCE_QUERY,
+                                                window[0],
+                                                constants.API_URI_ANSWERS_UNTIL_QUERY,
+                                                window[1],
+                                                self._filter_query())
+        if window[1] < time.time() - constants.CACHE_WINDOW_SETTLE_SECONDS:
+            ttl = constants.CACHE_TTL_CLOSED_WINDOW
+        else:
+            ttl = constants.CACHE_TTL_OPEN_WINDOW
+        seen_answer_ids = set()
+        for item in self._iter_pages(url, ttl):
+            if item['answer_id'] not in seen_answer_ids:
+                seen_answer_ids.add(item['answer_id'])
+                yield item
+
+    def _retrieve_pages(self, url, ttl):
+        """ Retrieve the items of every page of the given url, while the API reports has_more. """
+        return list(self._iter_pages(url, ttl))
+
+    def _iter_pages(self, url, ttl):
+        """ Yield the items of every page of the given url, while the API reports has_more.
+
+        The pages are cached for ttl seconds, when the cache is enabled.
+        """
+        page = 1
+        while True:
+            wrapper = dict()
+            for item in self._iter_page('{0}{1}{2}'.format(url, constants.API_URI_PAGE_QUERY, page), ttl, wrapper):
+                yield item
+            if not wrapper.get('has_more'):
+                return
+            page += 1
+
+    def _iter_page(self, url, ttl, wrapper):
+        """ Request the url and yield the items of its JSON object, raising APIResponseError on failure.
+
+        The other fields of the JSON object are put in the wrapper dictionary. A cached JSON object
+        is used instead, if available; successful responses are cached for ttl seconds.
+        """
+        if self.cache is not None:
+            response_json = self.cache.get(url)
+            if response_json is not None:
+                wrapper.update((key, value) for key, value in response_json.items() if key != 'items')
+                for item in response_json['items']:
+                    yield item
+                return
+
+        response = self._send(url)
+        try:
+            if response.status_code != constants.API_SUCCESS_CODE_RESPONSE:
+                try:
+                    response_json = response.json()
+                except ValueError:
+                    response_json = dict()
+                self.scheduler.observe(response_json)
+                raise APIResponseError(response.status_code, response_json)
+
+            if response.headers.get('Content-Encoding') != 'gzip' and not self._warned_uncompressed:
+                self._warned_uncompressed = True
+                logging.warning('The API responses are not gzip compressed')
+            decoded_size = [0]
+            chunks = APIRequest._counted(response.iter_content(constants.API_STREAM_CHUNK_SIZE), decoded_size)
+            if self.metrics is not None:
+                chunks = self.metrics.timed_download(chunks)
+            page_stream = JSONPageStream(chunks)
+            # Keep the items of the page only to cache them.
+            items = [] if self.cache is not None else None
+            for item in page_stream if self.metrics is None else self.metrics.timed_parse(page_stream):
+                if items is not None:
+                    items.append(item)
+                yield item
+            # The raw response counts the bytes received over the connection, before they are decompressed.
+            self.scheduler.observe_transfer(response.raw.tell(), decoded_size[0])
+        finally:
+            response.close()
+        self.scheduler.observe(page_stream.wrapper)
+        wrapper.update(page_stream.wrapper)
+        if self.cache is not None:
+            self.cache.put(url, dict(page_stream.wrapper, items=items), ttl)
+
+    def _send(self, url):
+        """ Request the url through the transport, when the scheduler allows it, and return the Response model. """
+        if self.metrics is not None:
+            return self.scheduler.send(lambda: self.metrics.timed_request(self.transport.get, url))
+        return self.scheduler.send(lambda: self.transport.get(url))
+
+    def map(self, function, iterable):
+        """ Apply function to every element of iterable concurrently, with the transport's concurrency. """
+        if self.profiler is not None:
+            function = self.profiler.wrap(function)
+        return self.transport.map(function, iterable)
+
+    def close(self):
+        """ Release the connections of the transport and close the caches. """
+        self.transport.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.comment_counts.close()
+
+    @staticmethod
+    def _counted(chunks, size):
+        """ Yield the chunks, adding their length to the first element of the size list. """
+        for chunk in chunks:
+            size[0] += len(chunk)
+            yield chunk
 
     @staticmethod
     def _datetime_to_timestamp(input_date):
@@ -76,75 +384,123 @@ class ResultDictionaryFactory(object):
 
     @staticmethod
     def mean(array):
-        """ Return the average of a list. """
-        return sum(array)/float(len(array))
+        """ Return the average of a list, or 0 for an empty list. """
+        return sum(array)/float(len(array)) if array else 0.0
 
 
 class PrintOption(object):
     """ Available print options for the stackstatistics application.
 
+    The output is written to the stream piece by piece, as it is rendered, so that its size does not
+    add to the memory used, however many the rows are.
+
     :param (dict) result_dict: A dictionary, the result of the
                                 stackstatistics data retrieval and analysis.
+    :param stream: An optional file object to write the output to, the standard output by default.
     """
-    def __init__(self, result_dict):
+    CSV_HEADER = ('since', 'until', 'statistic', 'answer_id', 'value')
+
+    def __init__(self, result_dict, stream=None):
         """ Return a PrintOption object whose result dictionary is defined as result_dict. """
         self.result_dict = result_dict
+        self.stream = stream or sys.stdout
 
     def json(self, indent=4):
-        """ Print to the console the result dictionary, in JSON format.
+        """ Print the result dictionary, in JSON format.
 
         :param (int) indent: An optional integer parameter defining
                               the JSON elements indent.
         """
-        print json.dumps(self.result_dict, indent=indent)
+        for chunk in json.JSONEncoder(indent=indent).iterencode(self.result_dict):
+            self.stream.write(chunk)
+        self.stream.write('\n')
+
+    def jsonl(self):
+        """ Print the result dictionary as a single line of JSON, to be followed by the ones of other results. """
+        self.json(indent=None)
+
+    def csv(self, header=True):
+        """ Print the result dictionary as CSV rows of since, until, statistic, answer_id and value.
+
+        Every statistic is a row, and so is the comment count of every answer with the highest score.
+
+        :param (bool) header: Whether to print the header row first, i.e. whether this is the first result.
+        """
+        writer = csv.writer(self.stream, lineterminator='\n')
+        if header:
+            writer.writerow(PrintOption.CSV_HEADER)
+        since, until = self.result_dict.get('since', ''), self.result_dict.get('until', '')
+        for key, value in self.result_dict.items():
+            if key == 'top_ten_answers_comment_count':
+                for answer_id, comment_count in value.items():
+                    writer.writerow((since, until, 'comment_count', answer_id, comment_count))
+            elif key not in ('since', 'until'):
+                writer.writerow((since, until, key, '', value))
 
     def tabular(self, comments_per_answer):
-        """ Print to the console the result dictionary, in tabular format.
+        """ Print the result dictionary, in tabular format.
+
+        The column widths depend on every row, so the table is rendered as a whole; the csv
+        and jsonl formats are meant for large outputs instead.
 
         :param (list) comments_per_answer: A list of tuples, the number of comments per answer, ready to
                                             be inserted in the tabulate function, in order to create a sub-table.
         """
+        # Imported here, so that the other output formats do not pay for it.
+        from tabulate import tabulate
+
         # Create an array of tuples to insert into the tabulate function.
         tabulate_data = [(key, value)
-                         if key is not 'top_ten_answers_comment_count'
+                         if key != 'top_ten_answers_comment_count'
                          else (key, tabulate(comments_per_answer, headers=['answer_id', 'comment_count']))
                          for key, value in self.result_dict.items()]
-        print tabulate(tabulate_data, headers=['Statistics', 'Values'])
+        self.stream.write(tabulate(tabulate_data, headers=['Statistics', 'Values']))
+        self.stream.write('\n')
 
     def html(self, comments_per_answer_items):
-        """ Print to the console the result dictionary, in HTML format.
+        """ Print the result dictionary, in HTML format, a table row at a time.
 
-        :param (list) comments_per_answer_items: A list of Item object instances, the number of comments per answer
-         as Item instances, so as to be handled by the _ItemSubTable class, in order to create an HTML sub-table.
+        :param comments_per_answer_items: An iterable of Item object instances, the number of comments per answer,
+                                           which are printed as an HTML sub-table.
         """
-        # Create an array of Item instances to be handled by the _ItemTable class.
-        items = [Item(key, value)
-                 if key is not 'top_ten_answers_comment_count'
-                 else (Item(key, _ItemSubTable(comments_per_answer_items)))
-                 for key, value in self.result_dict.items()]
-        table = _ItemTable(items)
-        print(table.__html__())
+        self.stream.write('<table>\n<thead><tr><th>Statistics</th><th>Values</th></tr></thead>\n<tbody>\n')
+        for key, value in self.result_dict.items():
+            self.stream.write('<tr><td>{0}</td><td>'.format(_escape_html(key)))
+            if key == 'top_ten_answers_comment_count':
+                self._html_sub_table(comments_per_answer_items)
+            else:
+                self.stream.write(_escape_html(value))
+            self.stream.write('</td></tr>\n')
+        self.stream.write('</tbody>\n</table>\n')
+
+    def _html_sub_table(self, items):
+        """ Print the HTML sub-table of the number of comments per answer. """
+        rows = iter(items)
+        item = next(rows, None)
+        if item is None:
+            self.stream.write('<p>No Items</p>')
+            return
+        self.stream.write('<table>\n<thead><tr><th>answer_id</th><th>comment_count</th></tr></thead>\n<tbody>\n')
+        while item is not None:
+            self.stream.write('<tr><td>{0}</td><td>{1}</td></tr>\n'.format(_escape_html(item.name),
+                                                                            _escape_html(item.description)))
+            item = next(rows, None)
+        self.stream.write('</tbody>\n</table>')
+
+
+def _escape_html(value):
+    """ Return the text of a value, with the HTML special characters escaped. """
+    return (str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            .replace('"', '&#34;').replace("'", '&#39;'))
 
 
 class Item(object):
-    """ A flask table Item.
+    """ A row of the HTML output.
 
     :param (str) name: A string, the value of the first column of the table.
-    :param description: A number (int or float) or a Table object, the value of the second column of the table.
+    :param description: A number (int or float), the value of the second column of the table.
     """
     def __init__(self, name, description):
         """ Return an Item object whose name is *name* and description is *description*. """
         self.name = name
         self.description = description
-
-
-class _ItemTable(Table):
-    """ Inherit from the Table class and specify the table headers. """
-    name = Col('Statistics')
-    description = Col('Values')
-
-
-class _ItemSubTable(Table):
-    """ Inherit from the Table class and specify the table headers. """
-    name = Col('answer_id')
-    description = Col('comment_count')
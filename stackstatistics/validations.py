@@ -4,9 +4,13 @@
 """
 This module contains all the validations needed for the stackstatistics package.
 """
-from datetime import datetime
+import re
+import csv
+from datetime import datetime, timedelta
 from argparse import ArgumentTypeError
 
+_DURATION_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days'}
+
 
 def valid_date_is(input_date):
     """ Validates that the user input date/time has a specific format.
@@ -19,3 +23,101 @@ def valid_date_is(input_date):
     except ValueError:
         msg = "Invalid input date: {0}".format(input_date)
         raise ArgumentTypeError(msg)
+
+
+def valid_positive_int(input_number):
+    """ Validates that the user input is a positive integer.
+
+    :param (str) input_number: A string, the number user input.
+    :returns: int.
+    """
+    try:
+        number = int(input_number)
+    except ValueError:
+        number = 0
+    if number < 1:
+        msg = "Invalid positive integer: {0}".format(input_number)
+        raise ArgumentTypeError(msg)
+    return number
+
+
+def valid_non_negative_int(input_number):
+    """ Validates that the user input is a non-negative integer.
+
+    :param (str) input_number: A string, the number user input.
+    :returns: int.
+    """
+    try:
+        number = int(input_number)
+    except ValueError:
+        number = -1
+    if number < 0:
+        msg = "Invalid non-negative integer: {0}".format(input_number)
+        raise ArgumentTypeError(msg)
+    return number
+
+
+def valid_positive_number(input_number):
+    """ Validates that the user input is a positive number.
+
+    :param (str) input_number: A string, the number user input.
+    :returns: float.
+    """
+    try:
+        number = float(input_number)
+    except ValueError:
+        number = 0
+    if not number > 0:
+        msg = "Invalid positive number: {0}".format(input_number)
+        raise ArgumentTypeError(msg)
+    return number
+
+
+def valid_share(input_number):
+    """ Validates that the user input is a number in the (0, 1] range.
+
+    :param (str) input_number: A string, the number user input.
+    :returns: float.
+    """
+    try:
+        number = float(input_number)
+    except ValueError:
+        number = 0
+    if not 0 < number <= 1:
+        msg = "Invalid share, not in the (0, 1] range: {0}".format(input_number)
+        raise ArgumentTypeError(msg)
+    return number
+
+
+def valid_duration(input_duration):
+    """ Validates that the user input is a duration, such as 90s, 30m, 1h or 7d.
+
+    :param (str) input_duration: A string, the duration user input.
+    :returns: timedelta.
+    """
+    match = re.match(r'^(\d+)([smhd])$', input_duration.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        msg = "Invalid duration: {0}".format(input_duration)
+        raise ArgumentTypeError(msg)
+    return timedelta(**{_DURATION_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def valid_windows_file(input_path):
+    """ Validates that the user input is a CSV file with a since,until date/time range per line.
+
+    A first line with the since,until header is skipped.
+
+    :param (str) input_path: A string, the file path user input.
+    :returns: A list of (since, until) datetime tuples.
+    """
+    try:
+        with open(input_path) as windows_file:
+            rows = [row for row in csv.reader(windows_file) if row]
+    except IOError as error:
+        raise ArgumentTypeError("Cannot read the windows file: {0}".format(error))
+    if rows and [cell.strip().lower() for cell in rows[0]] == ['since', 'until']:
+        rows = rows[1:]
+    if not rows or any(len(row) != 2 for row in rows):
+        msg = "Invalid windows file, expected a since,until date/time range per line: {0}".format(input_path)
+        raise ArgumentTypeError(msg)
+    return [(valid_date_is(since.strip()), valid_date_is(until.strip())) for since, until in rows]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures the end-to-end throughput, memory peak and number of API requests of the application,
+over a day of 100 to 1M answers served by a local stub of the API.
+
+Every round runs `statistics` in a new process, so that its memory peak is measured apart from
+the stub server and the test runner (on Linux). Run it explicitly, with pytest-benchmark installed, with:
+
+    py.test tests/benchmarks/bench_end_to_end.py
+"""
+import re
+import sys
+import time
+import subprocess
+from datetime import datetime
+
+from pytest import fixture, importorskip, mark
+
+from stub_server import GeneratedAnswers, GeneratedComments, StubStackExchangeServer
+
+importorskip('pytest_benchmark')
+
+DAY = datetime(2017, 6, 9)
+CONCURRENCY = 8
+ROUNDS = 3
+# Runs the application, writing the memory statistics of its process to the standard error at the end.
+RUN_STATISTICS = ("import sys\n"
+                  "from stackstatistics import main\n"
+                  "main()\n"
+                  "sys.stderr.write(open('/proc/self/status').read())")
+
+
+@fixture
+def answers_server(request):
+    since = int(time.mktime(DAY.timetuple()))
+    # A million answers take more requests than the daily quota of the API.
+    server = StubStackExchangeServer(GeneratedAnswers(request.param, since), GeneratedComments(),
+                                     quota_max=10 ** 6).start()
+    yield server
+    server.stop()
+
+
+def run_statistics(server, *arguments):
+    """ Run `statistics` against the server in a new process, returning its memory peak in kilobytes.
+
+    The peak is the high-water mark of the resident memory of the process, as reported by Linux.
+    The ru_maxrss of a child process is not used, because it starts from the memory of its parent.
+    """
+    process = subprocess.Popen([sys.executable, '-c', RUN_STATISTICS,
+                                '--api-url', server.url, '--no-cache', '--output-format', 'json',
+                                '--since', str(DAY), '--until', DAY.strftime('%Y-%m-%d 23:59:59'),
+                                '--max-requests-per-second', '100000'] + list(arguments),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, errors = process.communicate()
+    assert process.returncode == 0, errors
+    return int(re.search(r'^VmHWM:\s*(\d+) kB$', errors, re.MULTILINE).group(1))
+
+
+@mark.parametrize('answers_server', [100, 1000, 10000, 100000, 1000000], indirect=True,
+                  ids=['answers_100', 'answers_1k', 'answers_10k', 'answers_100k', 'answers_1M'])
+@mark.parametrize('transport', ['sync', 'async'])
+def test_end_to_end(benchmark, answers_server, transport):
+    """ Benchmark a run of `statistics`, recording the answers per second, the memory peak and the requests. """
+    elapsed, memory_peaks = [], []
+
+    def run():
+        del answers_server.requested_paths[:]
+        start = time.time()
+        memory_peaks.append(run_statistics(answers_server, '--transport', transport, '--concurrency', str(CONCURRENCY)))
+        elapsed.append(time.time() - start)
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+
+    benchmark.extra_info['answers'] = len(answers_server.answers)
+    benchmark.extra_info['answers_per_second'] = round(len(answers_server.answers) / min(elapsed))
+    benchmark.extra_info['peak_rss_kilobytes'] = max(memory_peaks)
+    benchmark.extra_info['requests'] = len(answers_server.requested_paths)
+    print('\n{0:>7} answers, {1:>5} transport: {2:.0f} answers/s, {3} kB peak memory, {4} requests'.format(
+        len(answers_server.answers), transport, benchmark.extra_info['answers_per_second'],
+        benchmark.extra_info['peak_rss_kilobytes'], benchmark.extra_info['requests']))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compares the wall-clock time of the sync and async transports, against a local stub of the API
+which delays every request and every new connection.
+
+Run it explicitly with: py.test -s tests/benchmarks/bench_transport.py
+"""
+import time
+from datetime import datetime, timedelta
+
+from pytest import fixture
+
+from stackstatistics.utils import APIRequest
+from stub_server import StubStackExchangeServer
+
+LATENCY = 0.02
+CONNECT_LATENCY = 0.05
+CONCURRENCY = 8
+
+
+@fixture(scope='module')
+def latency_server():
+    since = int(time.mktime(datetime(2017, 6, 9).timetuple()))
+    # 24 hourly sub-windows of 250 answers, 3 pages each.
+    answers = [{'answer_id': index, 'question_id': index // 3, 'score': index % 97,
+                'is_accepted': index % 4 == 0, 'creation_date': since + index * 14}
+               for index in range(6000)]
+    comments = [{'comment_id': index, 'post_id': index // 2} for index in range(1000)]
+    server = StubStackExchangeServer(answers, comments, LATENCY, CONNECT_LATENCY).start()
+    yield server
+    server.stop()
+
+
+def retrieve(server, transport):
+    """ Retrieve every answer of the day and the comments of 500 of them, returning the elapsed seconds. """
+    api_request = APIRequest({'since': datetime(2017, 6, 9), 'until': datetime(2017, 6, 9) + timedelta(days=1),
+                              'api_url': server.url, 'concurrency': CONCURRENCY, 'transport': transport})
+    start = time.time()
+    answers = api_request.retrieve_all_answers()
+    api_request.retrieve_all_comments(range(500))
+    elapsed = time.time() - start
+    api_request.close()
+    assert len(answers) == len(server.answers)
+    return elapsed
+
+
+def test_transport_wall_clock(latency_server):
+    """ The async transport reuses its connections, so it should not pay a handshake per request. """
+    elapsed = dict()
+    for transport in ('sync', 'async'):
+        del latency_server.requested_paths[:]
+        latency_server.connections = 0
+        elapsed[transport] = retrieve(latency_server, transport)
+        print('\n{0:>5} transport: {1:.3f}s, {2} requests, {3} connections'.format(
+            transport, elapsed[transport], len(latency_server.requested_paths), latency_server.connections))
+
+    assert elapsed['async'] < elapsed['sync']
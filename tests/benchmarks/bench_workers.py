@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measures how the throughput of the application scales with the number of worker processes (--workers),
+from 1 to the number of cores, over a day of generated answers served by a local stub of the API.
+
+The stub server runs on as many processes as there are cores, so that it does not limit the scaling.
+Run it explicitly, with pytest-benchmark installed, with:
+
+    py.test -s tests/benchmarks/bench_workers.py
+"""
+import time
+from datetime import datetime
+from multiprocessing import cpu_count
+
+from pytest import fixture, importorskip, mark
+
+from stub_server import GeneratedAnswers, GeneratedComments, StubStackExchangeServer
+from bench_end_to_end import run_statistics
+
+importorskip('pytest_benchmark')
+
+ANSWERS = 200000
+WORKERS = sorted(set([1, 2] + [2 ** power for power in range(8) if 2 ** power <= cpu_count()] + [cpu_count()]))
+ROUNDS = 3
+
+elapsed = dict()
+
+
+@fixture(scope='module')
+def answers_server():
+    since = int(time.mktime(datetime(2017, 6, 9).timetuple()))
+    server = StubStackExchangeServer(GeneratedAnswers(ANSWERS, since), GeneratedComments(),
+                                     quota_max=10 ** 6).start(processes=cpu_count())
+    yield server
+    server.stop()
+
+
+@mark.parametrize('workers', WORKERS)
+def test_workers_scaling(benchmark, answers_server, workers):
+    """ Benchmark a run of `statistics` with the given number of workers, recording its speed-up over one worker. """
+    rounds = []
+
+    def run():
+        start = time.time()
+        run_statistics(answers_server, '--workers', str(workers), '--transport', 'async')
+        rounds.append(time.time() - start)
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+
+    elapsed[workers] = min(rounds)
+    benchmark.extra_info['answers_per_second'] = round(ANSWERS / elapsed[workers])
+    if 1 in elapsed:
+        benchmark.extra_info['speedup'] = round(elapsed[1] / elapsed[workers], 2)
+    print('\n{0:>3} workers on {1} cores: {2:.0f} answers/s, {3}x'.format(
+        workers, cpu_count(), benchmark.extra_info['answers_per_second'], benchmark.extra_info.get('speedup')))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared fixtures of the application tests.
+"""
+import time
+from datetime import datetime
+
+from pytest import fixture
+
+from stub_server import StubStackExchangeServer
+
+
+@fixture
+def stub_since():
+    return datetime(2017, 6, 9, 10, 0)
+
+
+@fixture
+def stub_answers(stub_since):
+    """ 250 answers spread over an hour and a half, on 50 questions, every third one accepted. """
+    since = int(time.mktime(stub_since.timetuple()))
+    return [{'answer_id': 1000 + index, 'question_id': 500 + index % 50, 'score': (index * 7) % 31,
+             'is_accepted': index % 3 == 0, 'creation_date': since + index * 20}
+            for index in range(250)]
+
+
+@fixture
+def stub_comments(stub_answers):
+    """ Up to three comments per answer. """
+    return [{'comment_id': answer['answer_id'] * 10 + index, 'post_id': answer['answer_id']}
+            for answer in stub_answers for index in range(answer['answer_id'] % 4)]
+
+
+@fixture
+def stub_server(stub_answers, stub_comments):
+    server = StubStackExchangeServer(stub_answers, stub_comments).start()
+    yield server
+    server.stop()
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+"""
+A local stub of the StackExchange API, used to test and benchmark the application without network access.
+
+The answers and comments are generated, or replayed from a fixture file recorded from the API with:
+
+    python tests/stub_server.py --since "2017-06-09 10:00:00" --until "2017-06-09 11:00:00" fixture.json
+"""
+import os
+import re
+import json
+import time
+import zlib
+import bisect
+import signal
+import socket
+import threading
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import datetime
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+
+
+class GeneratedAnswers(object):
+    """ A read-only sequence of count answer items, computed on access rather than kept in memory.
+
+    The answers are spread evenly over the given seconds from since, three per question, every third
+    one accepted, with the fields of a default API answer item, so that the pages have a realistic size.
+
+    :param (int) count: The number of answers.
+    :param (int) since: The creation timestamp of the first answer.
+    :param (int) seconds: The seconds over which the answers are spread.
+    """
+    def __init__(self, count, since, seconds=86400):
+        """ Return a GeneratedAnswers sequence. """
+        self.count = count
+        self.since = since
+        self.seconds = seconds
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        """ Return the answer item at index, in creation date order. """
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        creation_date = self.since + index * self.seconds // self.count
+        return {'owner': {'reputation': index % 9973, 'user_id': 100000 + index % 65537, 'user_type': 'registered',
+                          'profile_image': 'https://www.gravatar.com/avatar/{0:032x}?s=128&d=identicon&r=PG'
+                                           .format(index),
+                          'display_name': 'user{0}'.format(index % 65537),
+                          'link': 'https://stackoverflow.com/users/{0}/user'.format(100000 + index % 65537)},
+                'is_accepted': index % 3 == 0,
+                'score': (index * 7919) % 101 - 10,
+                'last_activity_date': creation_date + index % 600,
+                'creation_date': creation_date,
+                'answer_id': 1000000 + index,
+                'question_id': 500000 + index // 3}
+
+
+class GeneratedComments(object):
+    """ The comments of GeneratedAnswers, computed on access: up to three per answer, by answer id. """
+    def get(self, post_id, default=()):
+        """ Return the comment items of the answer with id post_id. """
+        return [{'comment_id': post_id * 10 + index, 'post_id': post_id} for index in range(post_id % 4)]
+
+
+def load_fixture(path):
+    """ Return the answers and comments of a fixture file, written by record_fixture.
+
+    :param (str) path: The path of the JSON fixture file.
+    :returns: A tuple with the list of answer items and the list of comment items.
+    """
+    with open(path) as fixture_file:
+        fixture = json.load(fixture_file)
+    return fixture['answers'], fixture['comments']
+
+
+def record_fixture(path, since, until, api_url=None):
+    """ Retrieve the answers of a date/time range, and their comments, from the API into a fixture file.
+
+    :param (str) path: The path of the JSON fixture file.
+    :param (datetime) since: The start date/time.
+    :param (datetime) until: The end date/time.
+    :param (str) api_url: The scheme and authority of the API, the StackExchange API by default.
+    """
+    from stackstatistics.utils import APIRequest
+    # Record whole items, so that the replayed pages are as large as the ones of the default filter.
+    api_request = APIRequest({'since': since, 'until': until, 'api_url': api_url, 'api_filter': 'default'})
+    try:
+        answers = api_request.retrieve_all_answers()
+        comments = api_request.retrieve_all_comments([answer['answer_id'] for answer in answers])
+    finally:
+        api_request.close()
+    with open(path, 'w') as fixture_file:
+        json.dump({'answers': answers, 'comments': comments}, fixture_file)
+
+
+class _CreationDates(object):
+    """ The creation dates of a sequence of answers sorted by creation date, for bisection. """
+    def __init__(self, answers):
+        self.answers = answers
+
+    def __len__(self):
+        return len(self.answers)
+
+    def __getitem__(self, index):
+        return self.answers[index]['creation_date']
+
+
+class StubStackExchangeServer(ThreadingMixIn, HTTPServer):
+    """ Serves the /2.2/answers and /2.2/answers/{ids}/comments endpoints from lists of items.
+
+    The answers are looked up by bisection of their creation dates, and the order of the answers of
+    every requested date/time range is computed once, so that serving a page does not depend on the
+    total number of answers.
+
+    :param (list) answers: A list of answer items (dictionaries), as returned by the API, or GeneratedAnswers.
+    :param (list) comments: A list of comment items (dictionaries), as returned by the API, or GeneratedComments.
+    :param (float) latency: The seconds every request is delayed by.
+    :param (float) connect_latency: The seconds every new connection is delayed by, as by a TCP and TLS handshake.
+    :param (int) failures: The number of first requests which are throttled, with a throttle_violation error.
+    :param (int) backoff: The backoff seconds every response asks for, if any.
+    :param (int) quota_max: The daily quota of requests reported by the responses.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, answers, comments=(), latency=0, connect_latency=0, failures=0, backoff=None, quota_max=10000):
+        """ Return a StubStackExchangeServer bound to a free local port. """
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _StubRequestHandler)
+        if not isinstance(answers, GeneratedAnswers):
+            answers = sorted(answers, key=lambda item: item['creation_date'])
+        self.answers = answers
+        self.comments = comments
+        if not isinstance(comments, GeneratedComments):
+            self._comments_by_post = defaultdict(list)
+            for item in comments:
+                self._comments_by_post[item['post_id']].append(item)
+        else:
+            self._comments_by_post = comments
+        self._answer_orders = dict()
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.failures = failures
+        self.backoff = backoff
+        self.quota_max = quota_max
+        self.connections = 0
+        self.requested_paths = []
+        self.bytes_sent = 0
+        self._filters = dict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._children = []
+
+    @classmethod
+    def from_fixture(cls, path, **kwargs):
+        """ Return a StubStackExchangeServer replaying the answers and comments of a fixture file. """
+        answers, comments = load_fixture(path)
+        return cls(answers, comments, **kwargs)
+
+    @property
+    def url(self):
+        """ The scheme and authority of the stub server. """
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def start(self, processes=1):
+        """ Serve requests on a background thread, and on processes - 1 forked processes.
+
+        The forked processes accept connections on the same socket, so that serving the requests is not
+        bound to a single core. Only the requests served by this process are recorded.
+        """
+        self._children = []
+        for _ in range(processes - 1):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    self.serve_forever()
+                finally:
+                    os._exit(0)
+            self._children.append(pid)
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stop serving requests and release the port. """
+        for pid in self._children:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def record(self, path):
+        """ Keep track of the requested paths, returning whether the request should be throttled. """
+        with self._lock:
+            self.requested_paths.append(path)
+            return len(self.requested_paths) <= self.failures
+
+    def answers_between(self, fromdate, todate):
+        """ Return the indices of the answers created in the [fromdate, todate] range, in descending score order. """
+        key = (fromdate, todate)
+        if key not in self._answer_orders:
+            creation_dates = _CreationDates(self.answers)
+            indices = range(bisect.bisect_left(creation_dates, fromdate), bisect.bisect_right(creation_dates, todate))
+            self._answer_orders[key] = sorted(indices, key=lambda index: self.answers[index]['score'], reverse=True)
+        return self._answer_orders[key]
+
+    def comments_of(self, answer_ids):
+        """ Return the comment items of the given answers. """
+        return [item for answer_id in sorted(answer_ids) for item in self._comments_by_post.get(answer_id, ())]
+
+    def add_comment(self, post_id):
+        """ Add a comment to the answer with id post_id, as if it was just posted, and return it.
+
+        The comments of GeneratedComments are fixed, so only the comments of a list can be added to.
+        """
+        with self._lock:
+            comments = self._comments_by_post[post_id]
+            item = {'comment_id': post_id * 10 + len(comments), 'post_id': post_id}
+            comments.append(item)
+        return item
+
+    def create_filter(self, fields):
+        """ Return the id of the filter of the given fields, which the API derives from the fields alone. """
+        filter_id = '!stub{0:x}'.format(zlib.crc32(';'.join(sorted(fields))) & 0xffffffff)
+        with self._lock:
+            self._filters[filter_id] = frozenset(fields)
+        return filter_id
+
+    def filter_fields(self, filter_id):
+        """ Return the fields of a created filter, or None if there is no such filter. """
+        with self._lock:
+            return self._filters.get(filter_id)
+
+    def record_connection(self):
+        """ Keep track of the number of connections. """
+        with self._lock:
+            self.connections += 1
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+    """ Answers the requests of a StubStackExchangeServer, keeping the connections alive. """
+    protocol_version = 'HTTP/1.1'
+    # Buffer the status line, headers and body of a response into a single write.
+    wbufsize = -1
+
+    def setup(self):
+        """ Delay the new connection by the connect latency of the server. """
+        BaseHTTPRequestHandler.setup(self)
+        # Send every response at once, instead of waiting for the acknowledgement of its previous segments.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.record_connection()
+        time.sleep(self.server.connect_latency)
+
+    def do_GET(self):
+        """ Serve a page of the answers or comments that match the request. """
+        throttled = self.server.record(self.path)
+        time.sleep(self.server.latency)
+        if throttled:
+            return self._respond(400, {'error_id': 502, 'error_name': 'throttle_violation',
+                                       'error_message': 'too many requests from this IP'})
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        if url.path == '/2.2/filters/create':
+            fields = query.get('include', '').split(';')
+            return self._respond(200, {'items': [{'filter': self.server.create_filter(fields), 'filter_type': 'safe',
+                                                  'included_fields': fields}],
+                                       'has_more': False})
+        fields = None
+        if 'filter' in query:
+            fields = self.server.filter_fields(query['filter'])
+            if fields is None:
+                return self._respond(400, {'error_id': 400, 'error_name': 'bad_parameter',
+                                           'error_message': 'filter'})
+        comments_path = re.match(r'^/2\.2/answers/([\d;]+)/comments$', url.path)
+        if comments_path:
+            answer_ids = set(int(answer_id) for answer_id in comments_path.group(1).split(';'))
+            if len(answer_ids) > 100:
+                return self._respond(400, {'error_id': 400, 'error_name': 'bad_parameter',
+                                           'error_message': 'ids'})
+            items = self.server.comments_of(answer_ids)
+        elif url.path == '/2.2/answers':
+            items = self.server.answers_between(int(query.get('fromdate', 0)), int(query.get('todate', 2 ** 31)))
+        else:
+            return self._respond(404, {'error_id': 404, 'error_name': 'no_method',
+                                       'error_message': 'no method found with this name'})
+
+        page = int(query.get('page', 1))
+        pagesize = int(query.get('pagesize', 30))
+        start = (page - 1) * pagesize
+        page_items = items[start:start + pagesize]
+        if not comments_path:
+            page_items = [self.server.answers[index] for index in page_items]
+        body = {'items': page_items,
+                'has_more': start + pagesize < len(items),
+                'quota_max': self.server.quota_max,
+                'quota_remaining': self.server.quota_max - len(self.server.requested_paths)}
+        if self.server.backoff is not None:
+            body['backoff'] = self.server.backoff
+        if fields is not None:
+            item_type = 'comment' if comments_path else 'answer'
+            body = dict((key, value) for key, value in body.items() if '.' + key in fields)
+            body['items'] = [dict((key, value) for key, value in item.items()
+                                  if '{0}.{1}'.format(item_type, key) in fields) for item in page_items]
+        self._respond(200, body)
+
+    def _respond(self, status_code, body):
+        """ Write the JSON body with the given status code, gzip compressed if accepted, as the API does. """
+        content = json.dumps(body)
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            content = compressor.compress(content) + compressor.flush()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        with self.server._lock:
+            self.server.bytes_sent += len(content)
+
+    def log_message(self, *args):
+        """ Keep the test output quiet. """
+        pass
+
+
+if __name__ == '__main__':
+    fixture_parser = ArgumentParser(description='Record a fixture of the stub server from the StackExchange API.')
+    fixture_parser.add_argument('--since', required=True, help='the start date/time, as "YYYY-MM-DD H:M:S"')
+    fixture_parser.add_argument('--until', required=True, help='the end date/time, as "YYYY-MM-DD H:M:S"')
+    fixture_parser.add_argument('--api-url', help='the scheme and authority of the API')
+    fixture_parser.add_argument('path', help='the path of the JSON fixture file')
+    arguments = fixture_parser.parse_args()
+    record_fixture(arguments.path, datetime.strptime(arguments.since, '%Y-%m-%d %H:%M:%S'),
+                   datetime.strptime(arguments.until, '%Y-%m-%d %H:%M:%S'), arguments.api_url)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the aggregation of the answer data.
+"""
+import json
+import pickle
+import threading
+
+from pytest import fixture
+
+from stackstatistics.aggregation import ScoreHistogram, TopK, StatisticsAggregator
+from stackstatistics.utils import ResultDictionaryFactory
+
+
+@fixture
+def aggregator(stub_answers):
+    return reduce(StatisticsAggregator.update, stub_answers, StatisticsAggregator())
+
+
+def test_statistics_aggregator_merge(aggregator, stub_answers):
+    """ Tests that merging the aggregators of disjoint parts equals the aggregator of the whole. """
+    first_part = reduce(StatisticsAggregator.update, stub_answers[:70], StatisticsAggregator())
+    second_part = reduce(StatisticsAggregator.update, stub_answers[70:], StatisticsAggregator())
+    assert first_part.merge(second_part) == aggregator
+
+
+def test_statistics_aggregator_freeze(aggregator, stub_answers):
+    """ Tests that a frozen aggregator can be merged into others by several threads at once. """
+    shared = reduce(StatisticsAggregator.update, stub_answers, StatisticsAggregator()).freeze()
+    merged = []
+    threads = [threading.Thread(target=lambda: merged.append(StatisticsAggregator().merge(shared)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert shared == aggregator and merged == [aggregator] * 8
+
+
+def test_statistics_aggregator_result(aggregator, stub_answers):
+    """ Tests that the results match the list-based ResultDictionaryFactory. """
+    accepted_answers_score_list = [answer['score'] for answer in stub_answers if answer['is_accepted']]
+    number_of_answers_per_question = dict()
+    for answer in stub_answers:
+        number_of_answers_per_question[answer['question_id']] = \
+            number_of_answers_per_question.get(answer['question_id'], 0) + 1
+    top_ten_answers = sorted(stub_answers, key=lambda answer: (answer['score'], answer['answer_id']), reverse=True)
+    aggregator.comments_per_answer[top_ten_answers[0]['answer_id']] = 2
+
+    result = aggregator.result()
+    expected = ResultDictionaryFactory().create(
+        accepted_answers_score_list, number_of_answers_per_question.values(),
+        dict((answer['answer_id'], 0) for answer in top_ten_answers[:10]))
+    expected['top_ten_answers_comment_count'][top_ten_answers[0]['answer_id']] = 2
+    for key in expected:
+        assert result[key] == expected[key]
+    assert result['accepted_answers_median_score'] == sorted(accepted_answers_score_list)[41]
+    assert result['accepted_answers_p90_score'] == sorted(accepted_answers_score_list)[75]
+
+
+def test_statistics_aggregator_empty():
+    """ Tests that an empty window does not divide by zero. """
+    result = StatisticsAggregator().result()
+    assert result['accepted_answers_average_score'] == 0
+    assert result['average_answers_per_question'] == 0
+    assert result['top_ten_answers_comment_count'] == {}
+    assert ResultDictionaryFactory.mean([]) == 0
+
+
+def test_statistics_aggregator_serialization(aggregator):
+    """ Tests that aggregators survive JSON serialization and pickling. """
+    aggregator.comments_per_answer[1000] = 3
+    assert StatisticsAggregator.from_dict(json.loads(json.dumps(aggregator.to_dict()))) == aggregator
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        assert pickle.loads(pickle.dumps(aggregator, protocol)) == aggregator
+
+
+def test_score_histogram():
+    """ Tests the percentiles of the ScoreHistogram sketch. """
+    histogram = ScoreHistogram()
+    for score in [5, 1, 3, 2, 4]:
+        histogram.add(score)
+    assert (histogram.percentile(50), histogram.percentile(90), histogram.percentile(100)) == (3, 5, 5)
+    assert ScoreHistogram().percentile(50) == 0
+    assert histogram.merge(ScoreHistogram({0: 5})).percentile(50) == 0
+
+
+def test_top_k(stub_answers):
+    """ Tests that TopK selects the highest scored answers whatever their order. """
+    expected = sorted(([answer['score'], answer['answer_id']] for answer in stub_answers), reverse=True)[:25]
+    top_k = TopK(25)
+    for answer in reversed(stub_answers):
+        top_k.push(answer['score'], answer['answer_id'])
+    assert top_k.items() == expected
+
+    first_part, second_part = TopK(25), TopK(25)
+    for index, answer in enumerate(stub_answers):
+        (first_part if index % 2 else second_part).push(answer['score'], answer['answer_id'])
+    assert first_part.merge(second_part).items() == expected
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the API response cache and the comment count memo of the application.
+"""
+import time
+import threading
+
+from pytest import fixture
+
+from stackstatistics import constants
+from stackstatistics.cache import CommentCountMemo, ResponseCache
+
+
+@fixture
+def response_json():
+    return {'items': [{'answer_id': 44456952, 'score': 3}], 'has_more': False}
+
+
+def test_response_cache_normalization():
+    """ Tests that equivalent urls share the same cache key. """
+    assert ResponseCache.normalize('https://API.stackexchange.com/2.2/answers?site=stackoverflow&page=2') == \
+        ResponseCache.normalize('https://api.stackexchange.com/2.2/answers?page=2&site=stackoverflow')
+
+
+def test_response_cache_get_put(tmpdir, response_json):
+    """ Tests that stored responses are returned until they expire, and the hit/miss counters. """
+    cache = ResponseCache(str(tmpdir))
+    url = 'https://api.stackexchange.com/2.2/answers?page=1'
+    assert cache.get(url) is None
+
+    cache.put(url, response_json, 60)
+    assert cache.get(url) == response_json
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.put(url, response_json, -1)
+    assert cache.get(url) is None, "Expired entries should not be returned"
+
+    # The entries persist across cache instances.
+    cache.put(url, response_json, 60)
+    cache.close()
+    assert ResponseCache(str(tmpdir)).get(url) == response_json
+
+
+def test_response_cache_eviction(tmpdir, response_json):
+    """ Tests that the least recently used entries are evicted when the cache exceeds its size. """
+    cache = ResponseCache(str(tmpdir), max_bytes=200)
+    for page in range(1, 4):
+        cache.put('https://api.stackexchange.com/2.2/answers?page={0}'.format(page), response_json, 60)
+        # Keep the first page recently used.
+        cache.get('https://api.stackexchange.com/2.2/answers?page=1')
+
+    assert cache.get('https://api.stackexchange.com/2.2/answers?page=1') == response_json
+    assert cache.get('https://api.stackexchange.com/2.2/answers?page=2') is None
+
+
+def test_comment_count_memo(tmpdir, monkeypatch):
+    """ Tests that the counts are remembered across memos, for longer the older the answers are. """
+    now = time.time()
+    memo = CommentCountMemo(str(tmpdir))
+    assert memo.claim([1, 2]) == ({}, [1, 2], {})
+    memo.put({1: 3, 2: 0}, {1: now - 10 * constants.CACHE_TTL_CLOSED_WINDOW, 2: now})
+    memo.close()
+
+    memo = CommentCountMemo(str(tmpdir))
+    assert memo.claim([1, 2]) == ({1: 3, 2: 0}, [], {})
+    # A day later, the count of the new answer is stale, while the one of the old answer is not.
+    monkeypatch.setattr(time, 'time', lambda: now + 24 * 60 * 60)
+    assert memo.claim([1, 2]) == ({1: 3}, [2], {})
+
+    assert CommentCountMemo.ttl(0) == constants.CACHE_TTL_OPEN_WINDOW
+    assert CommentCountMemo.ttl(10 * 365 * 24 * 60 * 60) == constants.CACHE_TTL_CLOSED_WINDOW
+    assert CommentCountMemo.ttl(100 * 24 * 60 * 60) == 5 * 24 * 60 * 60
+
+
+def test_comment_count_memo_claims():
+    """ Tests that the answers claimed by a caller are waited for by the others, until put or released. """
+    memo = CommentCountMemo()
+    assert memo.claim([1, 2]) == ({}, [1, 2], {})
+    counts, claimed, claimed_by_others = memo.claim([1, 2, 3])
+    assert (counts, claimed, sorted(claimed_by_others)) == ({}, [3], [1, 2])
+
+    waiter = threading.Thread(target=claimed_by_others[1].wait)
+    waiter.start()
+    memo.put({1: 4}, {})
+    waiter.join()
+    memo.release([2])
+    assert claimed_by_others[2].is_set()
+    assert memo.claim([1, 2]) == ({1: 4}, [2], {})
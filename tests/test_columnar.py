@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the columnar storage of the answer data, with and without NumPy.
+"""
+from pytest import fixture, importorskip
+
+from stackstatistics import columnar
+from stackstatistics.columnar import AnswerColumns
+from stackstatistics.aggregation import StatisticsAggregator
+
+
+@fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    """ Run a test with the NumPy operations, and again with the array fallback. """
+    if request.param == 'numpy':
+        importorskip('numpy')
+    else:
+        monkeypatch.setattr(columnar, '_numpy', None)
+    return request.param
+
+
+def test_answer_columns_statistics(backend, stub_answers):
+    """ Tests that the vectorized statistics match the single-pass aggregator. """
+    answer_columns = AnswerColumns(stub_answers)
+    assert len(answer_columns) == len(stub_answers)
+    assert answer_columns.column('score')[3] == stub_answers[3]['score']
+
+    expected_aggregator = reduce(StatisticsAggregator.update, stub_answers, StatisticsAggregator())
+    assert StatisticsAggregator().update_columns(answer_columns) == expected_aggregator
+    assert answer_columns.top(300) == reduce(StatisticsAggregator.update, stub_answers,
+                                             StatisticsAggregator(300)).top_answers.items()
+
+
+def test_answer_columns_empty(backend):
+    """ Tests that an empty store does not divide by zero. """
+    answer_columns = AnswerColumns()
+    assert StatisticsAggregator().update_columns(answer_columns) == StatisticsAggregator()
+    assert answer_columns.top(10) == []
+    assert StatisticsAggregator().update_columns(answer_columns).result()['average_answers_per_question'] == 0
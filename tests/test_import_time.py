@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the start-up cost of the application: the heavy dependencies must be imported lazily.
+"""
+import sys
+import time
+import subprocess
+
+# The seconds that importing the package may add to the interpreter start-up, best of several runs.
+IMPORT_TIME_BUDGET = 0.15
+LAZY_MODULES = ('requests', 'urllib3', 'tabulate', 'flask_table', 'flask', 'jinja2', 'multiprocessing',
+                'BaseHTTPServer')
+
+
+def best_run_time(code, runs=5):
+    """ Return the best wall-clock time of running code in a new interpreter. """
+    best = float('inf')
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        best = min(best, time.time() - start)
+    return best
+
+
+def test_lazy_imports():
+    """ Tests that importing the package does not import the transport and the renderer dependencies. """
+    output = subprocess.check_output([sys.executable, '-c',
+                                      'import sys, stackstatistics; print(" ".join(sys.modules))'])
+    imported_modules = set(module.split('.')[0] for module in output.split())
+    assert imported_modules.isdisjoint(LAZY_MODULES), \
+        "Lazily imported modules were imported: {0}".format(imported_modules.intersection(LAZY_MODULES))
+
+
+def test_import_time_budget():
+    """ Tests that `statistics --version` starts within the import time budget. """
+    interpreter_time = best_run_time('pass')
+    version_time = best_run_time("import sys; sys.argv = ['statistics', '--version']; "
+                                 "from stackstatistics import main; main()")
+    assert version_time - interpreter_time < IMPORT_TIME_BUDGET, \
+        "statistics --version took {0:.3f}s, the interpreter alone {1:.3f}s".format(version_time, interpreter_time)
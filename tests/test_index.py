@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the local index of the answer and comment data.
+"""
+import time
+from datetime import timedelta
+
+from pytest import fixture
+
+from stackstatistics.index import AnswerIndex
+from stackstatistics.aggregation import StatisticsAggregator
+
+
+@fixture
+def answer_index(tmpdir, stub_answers, stub_comments):
+    answer_index = AnswerIndex(str(tmpdir))
+    answer_index.add_answers(stub_answers)
+    answer_index.add_comments(stub_comments)
+    yield answer_index
+    answer_index.close()
+
+
+def test_answer_index_aggregate(answer_index, stub_answers, stub_since):
+    """ Tests that the SQL aggregates match the aggregator of the answers of a date/time range. """
+    since, until = stub_since + timedelta(minutes=10), stub_since + timedelta(minutes=50)
+    answers = [answer for answer in stub_answers
+               if time.mktime(since.timetuple()) <= answer['creation_date'] <= time.mktime(until.timetuple())]
+    assert answer_index.answer_ids(since, until) == [answer['answer_id'] for answer in answers]
+    expected = reduce(StatisticsAggregator.update, answers, StatisticsAggregator(25))
+    aggregator = answer_index.aggregate(since, until, 25)
+    expected.comments_per_answer = dict((answer_id, answer_id % 4) for answer_id in expected.top_answer_ids())
+    assert aggregator == expected
+    assert answer_index.aggregate(since - timedelta(days=1), since - timedelta(hours=1)) == StatisticsAggregator()
+
+    # Answers stored again replace the stored ones.
+    answer_index.add_answers(answers)
+    assert answer_index.aggregate(since, until, 25) == expected
+
+
+def test_answer_index_covers(answer_index, stub_since):
+    """ Tests that the ingested date/time ranges are joined when they meet. """
+    hour = timedelta(hours=1)
+    assert not answer_index.covers(stub_since, stub_since + hour)
+    answer_index.add_range(stub_since, stub_since + hour - timedelta(seconds=1))
+    answer_index.add_range(stub_since + hour, stub_since + 2 * hour)
+    assert answer_index.covers(stub_since + timedelta(minutes=30), stub_since + 2 * hour)
+    assert not answer_index.covers(stub_since, stub_since + 3 * hour)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the incremental parsing of the API responses.
+"""
+import json
+
+from pytest import fixture, raises
+
+from stackstatistics.jsonstream import JSONPageStream
+
+
+@fixture
+def response_json():
+    return {'items': [{'answer_id': 44456952, 'score': 12, 'title': u'caf\u00e9 \u2603'},
+                      {'answer_id': 44471411, 'score': -1, 'owner': {'display_name': 'x', 'reputation': 1}}],
+            'has_more': True, 'quota_max': 300, 'quota_remaining': 12345}
+
+
+def chunked(text, size):
+    return (text[index:index + size] for index in range(0, len(text), size))
+
+
+def test_json_page_stream(response_json):
+    """ Tests that the items and the wrapper fields are parsed, whatever the chunk boundaries. """
+    body = json.dumps(response_json, ensure_ascii=False).encode('utf-8')
+    for size in (1, 2, 7, 64, len(body)):
+        page_stream = JSONPageStream(chunked(body, size))
+        assert list(page_stream) == response_json['items']
+        assert page_stream.wrapper == {'has_more': True, 'quota_max': 300, 'quota_remaining': 12345}
+
+
+def test_json_page_stream_without_items():
+    """ Tests responses with the wrapper fields first, or no items at all. """
+    page_stream = JSONPageStream(chunked(b'{"has_more": false, "items": [ ], "quota_max": 5}', 3))
+    assert list(page_stream) == []
+    assert page_stream.wrapper == {'has_more': False, 'quota_max': 5}
+
+    page_stream = JSONPageStream([b'{ }'])
+    assert list(page_stream) == []
+
+    with raises(ValueError):
+        list(JSONPageStream(chunked(b'{"items": [{"answer_id": 1}', 4)))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the measurement and the profiling of the application runs.
+"""
+import json
+import pickle
+import pstats
+import threading
+from StringIO import StringIO
+
+from stackstatistics.metrics import Profiler, RunMetrics
+
+
+def test_run_metrics():
+    """ Tests the phases, the request latency percentiles and the download counters of RunMetrics. """
+    metrics = RunMetrics()
+    with metrics.phase('answers'):
+        sum(range(10000))
+    metrics.add_phase('answers', 1.0, 0.5)
+    metrics.add_phase('output', 0.25, 0.25)
+    metrics.latencies.extend(latency / 100.0 for latency in range(1, 21))
+    chunks = list(metrics.timed_download(['{"items": [', '1, 2', ']}']))
+    assert list(metrics.timed_parse([1, 2])) == [1, 2]
+
+    worker_metrics = pickle.loads(pickle.dumps(metrics))
+    metrics.merge(worker_metrics)
+    result = metrics.to_dict()
+    assert list(result['phases']) == ['answers', 'output']
+    assert result['phases']['answers']['wall_seconds'] >= 1.0
+    assert result['phases']['output'] == {'wall_seconds': 0.25, 'cpu_seconds': 0.25}
+    assert (result['responses'], result['latency_p50_seconds'], result['latency_p95_seconds']) == (40, 0.1, 0.19)
+    assert result['bytes_downloaded'] == 2 * len(''.join(chunks))
+    assert result['peak_rss_kilobytes'] > 0
+
+    stream = StringIO()
+    metrics.write(stream)
+    assert json.loads(stream.getvalue())['responses'] == 40
+    assert RunMetrics().to_dict()['latency_p95_seconds'] == 0
+
+
+def test_profiler(tmpdir):
+    """ Tests that the calls of the main thread and of the threads it dispatches to are profiled together. """
+    def main_thread_function():
+        return sum(range(1000))
+
+    def other_thread_function():
+        return sorted(range(1000))
+
+    profiler = Profiler()
+    profiler.start()
+    main_thread_function()
+    thread = threading.Thread(target=profiler.wrap(other_thread_function))
+    thread.start()
+    thread.join()
+    profiler.stop()
+
+    path = str(tmpdir.join('statistics.prof'))
+    profiler.dump(path)
+    profiled_functions = set(function_name for _, _, function_name in pstats.Stats(path).stats)
+    assert set(['main_thread_function', 'other_thread_function']).issubset(profiled_functions)
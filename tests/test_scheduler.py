@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the scheduling of the API requests.
+"""
+import time
+
+from pytest import raises
+
+from stackstatistics.scheduler import RequestScheduler, QuotaExceededError
+from stackstatistics.transport import SyncTransport
+from stub_server import StubStackExchangeServer
+
+
+def test_request_scheduler_retries(stub_answers):
+    """ Tests that throttled requests are retried, until the retries run out. """
+    server = StubStackExchangeServer(stub_answers, failures=3).start()
+    url = '{0}/2.2/answers?pagesize=10'.format(server.url)
+    try:
+        scheduler = RequestScheduler(max_retries=3, retry_base_seconds=0.01)
+        response = scheduler.send(lambda: SyncTransport(1).get(url))
+        assert response.status_code == 200
+        assert scheduler.stats()['requests'] == 4
+        assert scheduler.stats()['retries'] == 3
+
+        del server.requested_paths[:]
+        response = RequestScheduler(max_retries=1, retry_base_seconds=0.01).send(lambda: SyncTransport(1).get(url))
+        assert response.status_code == 400, "The last response should be returned when the retries run out"
+    finally:
+        server.stop()
+
+
+def test_request_scheduler_backoff_and_quota():
+    """ Tests that the backoff field delays the next request, and that the quota share is respected. """
+    scheduler = RequestScheduler(quota_share=0.5)
+    scheduler.observe({'backoff': 0.2, 'quota_max': 100, 'quota_remaining': 60})
+    start = time.time()
+    scheduler.send(lambda: _Response(200))
+    assert time.time() - start >= 0.15
+    assert scheduler.stats()['throttled_seconds'] >= 0.15
+
+    scheduler.observe({'quota_max': 100, 'quota_remaining': 50})
+    with raises(QuotaExceededError):
+        scheduler.send(lambda: _Response(200))
+
+
+class _Response(object):
+    """ A minimal Response model. """
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def json(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def test_request_scheduler_merge_stats():
+    """ Tests that the stats of the schedulers of worker processes add up. """
+    scheduler = RequestScheduler()
+    scheduler.merge_stats({'requests': 3, 'retries': 1, 'throttled_seconds': 0.5, 'bytes_received': 300,
+                           'bytes_decoded': 1200, 'quota_remaining': 90})
+    scheduler.merge_stats({'requests': 2, 'retries': 0, 'throttled_seconds': 0.25, 'bytes_received': 200,
+                           'bytes_decoded': 800, 'quota_remaining': 80})
+    assert scheduler.stats() == {'requests': 5, 'retries': 1, 'throttled_seconds': 0.75, 'bytes_received': 500,
+                                 'bytes_decoded': 2000, 'quota_remaining': 80}
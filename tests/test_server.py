@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the HTTP server of `statistics serve`, against the local stub of the StackExchange API.
+"""
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+import urllib2
+from urllib import urlencode
+from collections import OrderedDict
+
+from pytest import fixture, raises
+
+from stackstatistics.server import Coalescer, StatisticsServer, StatisticsService
+
+
+@fixture
+def statistics_server(stub_server):
+    service = StatisticsService({'api_url': stub_server.url, 'no_cache': True, 'transport': 'async'})
+    server = StatisticsServer(('127.0.0.1', 0), service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def get_stats(server, **query):
+    """ Query the server and return the status code and the body of the response. """
+    try:
+        response = urllib2.urlopen('{0}/stats?{1}'.format(server.url, urlencode(query)))
+    except urllib2.HTTPError as error:
+        return error.code, error.read()
+    return response.getcode(), response.read()
+
+
+def test_server_statistics(statistics_server, stub_server):
+    """ Tests that the server computes the statistics as the command does, keeping the sub-windows warm. """
+    status_code, body = get_stats(statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 11:30:00')
+    result = json.loads(body, object_pairs_hook=OrderedDict)
+    assert status_code == 200
+    assert result['total_accepted_answers'] == 84
+    assert len(result['top_ten_answers_comment_count']) == 10
+
+    # The sub-windows and the comment counts of their top answers are kept in memory.
+    del stub_server.requested_paths[:]
+    status_code, body = get_stats(statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 11:30:00',
+                                  format='csv', top='3')
+    assert status_code == 200
+    assert body.splitlines()[0] == 'since,until,statistic,answer_id,value'
+    assert len([row for row in body.splitlines() if ',comment_count,' in row]) == 3
+    assert stub_server.requested_paths == []
+
+
+def test_server_coalesced_requests(statistics_server, stub_server):
+    """ Tests that concurrent identical queries are served by a single retrieval. """
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_stats(
+        statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 12:00:00'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(results)) == 1 and results[0][0] == 200
+    answer_pages = [path for path in stub_server.requested_paths if '/comments' not in path]
+    assert len(answer_pages) == len(set(answer_pages)), "Every page should be requested once"
+
+
+def test_server_concurrent_first_requests(stub_server):
+    """ Tests that the first queries of a new server process are all answered, even when concurrent. """
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    process = subprocess.Popen([sys.executable, '-c', 'from stackstatistics import main; main()', 'serve',
+                                '--port', str(port), '--api-url', stub_server.url, '--no-cache'])
+    try:
+        url = 'http://127.0.0.1:{0}/stats?{1}'.format(port, urlencode({'since': '2017-06-09 10:00:00',
+                                                                     'until': '2017-06-09 11:30:00'}))
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except socket.error:
+                time.sleep(0.1)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(urllib2.urlopen(url).getcode()))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [200] * 8
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def test_server_errors(statistics_server):
+    """ Tests that invalid queries are answered with a JSON error. """
+    status_code, body = get_stats(statistics_server, since='2017-06-09', until='2017-06-09 11:30:00')
+    assert status_code == 400 and 'Invalid input date' in json.loads(body)['error_message']
+    assert get_stats(statistics_server, since='2017-06-09 12:00:00', until='2017-06-09 11:30:00')[0] == 400
+    assert get_stats(statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 11:30:00',
+                     format='xml')[0] == 400
+    with raises(urllib2.HTTPError) as error:
+        urllib2.urlopen('{0}/missing'.format(statistics_server.url))
+    assert error.value.code == 404
+
+
+def test_server_failures(statistics_server, monkeypatch):
+    """ Tests that the queries are answered with a JSON error when the API is unreachable, or anything fails. """
+    unreachable_service = StatisticsService({'api_url': 'http://127.0.0.1:1', 'no_cache': True, 'max_retries': 0})
+    monkeypatch.setattr(statistics_server, 'service', unreachable_service)
+    status_code, body = get_stats(statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 11:30:00')
+    unreachable_service.close()
+    assert status_code == 502 and 'Unable to reach the API' in json.loads(body)['error_message']
+
+    def failing_statistics(since, until, top):
+        raise RuntimeError('failure')
+    monkeypatch.setattr(statistics_server.service, 'statistics', failing_statistics)
+    status_code, body = get_stats(statistics_server, since='2017-06-09 10:00:00', until='2017-06-09 11:30:00')
+    assert status_code == 500 and json.loads(body)['error_message'] == 'Internal error: failure'
+
+
+def test_coalescer():
+    """ Tests that the callers of a call in progress get its result, and its error. """
+    coalescer, calls = Coalescer(), []
+
+    def slow_call(value):
+        calls.append(value)
+        started.set()
+        release.wait()
+        if value < 0:
+            raise ValueError(value)
+        return value
+
+    for value in (1, -1):
+        results, started, release = [], threading.Event(), threading.Event()
+
+        def call():
+            try:
+                results.append(coalescer.call('key', slow_call, value))
+            except ValueError as error:
+                results.append(error)
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=call) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # Let the followers reach the call in progress.
+        time.sleep(0.2)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+        assert len(results) == 4 and len(set(map(repr, results))) == 1
+    assert calls == [1, -1]
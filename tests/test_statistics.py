@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the main functionality of the application, against the local stub of the StackExchange API.
+"""
+import csv
+import json
+import pstats
+from collections import OrderedDict
+
+from pytest import fixture, raises
+
+from stackstatistics import statistics
+
+
+@fixture
+def run_statistics(monkeypatch, capsys, stub_server):
+    """ Run the statistics command with the given arguments and return its JSON output. """
+    def run(*arguments):
+        monkeypatch.setattr(statistics, 'argv', ['statistics', '--output-format', 'json',
+                                                 '--api-url', stub_server.url] + list(arguments))
+        statistics.main()
+        return json.loads(capsys.readouterr()[0], object_pairs_hook=OrderedDict)
+    return run
+
+
+@fixture
+def run_statistics_lines(monkeypatch, capsys, stub_server):
+    """ Run the statistics command with the given arguments and return its JSON lines output. """
+    def run(*arguments):
+        monkeypatch.setattr(statistics, 'argv', ['statistics', '--api-url', stub_server.url] + list(arguments))
+        statistics.main()
+        return [json.loads(line, object_pairs_hook=OrderedDict) for line in capsys.readouterr()[0].splitlines()]
+    return run
+
+
+def test_main_incremental(run_statistics, stub_server, tmpdir):
+    """ Tests that an incremental run reuses the previous sub-windows and produces the same results. """
+    first_window = ['--since', '2017-06-09 10:00:00', '--until', '2017-06-09 10:59:59']
+    whole_window = ['--since', '2017-06-09 10:00:00', '--until', '2017-06-09 11:30:00']
+    expected = run_statistics('--no-cache', *whole_window)
+    full_requests = len(stub_server.requested_paths)
+
+    run_statistics('--incremental', '--cache-dir', str(tmpdir), *first_window)
+    # Keep only the stored partials, so that the responses cannot be served by the cache.
+    tmpdir.join('responses.sqlite').remove()
+    del stub_server.requested_paths[:]
+    result = run_statistics('--incremental', '--cache-dir', str(tmpdir), *whole_window)
+
+    assert result == expected
+    assert 0 < len(stub_server.requested_paths) < full_requests, "Only the uncovered sub-windows should be requested"
+    assert expected['total_accepted_answers'] == 84
+    assert len(expected['top_ten_answers_comment_count']) == 10
+
+
+def test_main_incremental_comment_counts(run_statistics, stub_server, tmpdir):
+    """ Tests that the comment counts of reused sub-windows are refreshed once the memo no longer holds them. """
+    window = ['--since', '2017-06-09 10:00:00', '--until', '2017-06-09 10:59:59']
+    first_result = run_statistics('--incremental', '--cache-dir', str(tmpdir), *window)
+    answer_id, comment_count = next(iter(first_result['top_ten_answers_comment_count'].items()))
+    stub_server.add_comment(int(answer_id))
+
+    # Forget the remembered counts and the responses, as if they were stale, but keep the stored partials.
+    tmpdir.join('comment_counts.sqlite').remove()
+    tmpdir.join('responses.sqlite').remove()
+    result = run_statistics('--incremental', '--cache-dir', str(tmpdir), *window)
+    assert result['top_ten_answers_comment_count'][answer_id] == comment_count + 1
+
+
+def test_main_top(run_statistics, stub_answers):
+    """ Tests that --top counts the comments of the given number of highest scored answers, in score order. """
+    result = run_statistics('--no-cache', '--top', '25', '--since', '2017-06-09 10:00:00',
+                            '--until', '2017-06-09 12:00:00')
+    top_answers = sorted(stub_answers, key=lambda answer: (answer['score'], answer['answer_id']), reverse=True)[:25]
+    assert [int(answer_id) for answer_id in result['top_ten_answers_comment_count']] == \
+        [answer['answer_id'] for answer in top_answers]
+    assert result['top_ten_answers_comment_count'][str(top_answers[0]['answer_id'])] == \
+        top_answers[0]['answer_id'] % 4
+
+
+def test_main_bucket(run_statistics, run_statistics_lines, stub_server):
+    """ Tests that --bucket outputs a JSON line per window, each equal to the result of its own run. """
+    stub_server.connections = 0
+    records = run_statistics_lines('--no-cache', '--bucket', '30m', '--since', '2017-06-09 10:00:00',
+                                   '--until', '2017-06-09 11:29:59')
+    bucket_requests = len(stub_server.requested_paths)
+    assert stub_server.connections <= 4 < bucket_requests, "The windows should share keep-alive connections"
+
+    assert [(record['since'], record['until']) for record in records] == \
+        [('2017-06-09 10:00:00', '2017-06-09 10:29:59'), ('2017-06-09 10:30:00', '2017-06-09 10:59:59'),
+         ('2017-06-09 11:00:00', '2017-06-09 11:29:59')]
+    for record in records:
+        result = run_statistics('--no-cache', '--since', record.pop('since'), '--until', record.pop('until'))
+        assert record == OrderedDict(sorted(result.items()))
+    assert bucket_requests < len(stub_server.requested_paths) - bucket_requests, \
+        "The windows should share their requests"
+
+
+def test_main_windows_file(run_statistics, run_statistics_lines, capsys, tmpdir):
+    """ Tests that --windows outputs a JSON line per date/time range of the file, overlapping or not. """
+    windows_file = tmpdir.join('windows.csv')
+    windows_file.write('since,until\n'
+                       '2017-06-09 10:00:00,2017-06-09 11:00:00\n'
+                       '2017-06-09 10:20:00,2017-06-09 10:50:00\n')
+    records = run_statistics_lines('--no-cache', '--windows', str(windows_file))
+
+    assert len(records) == 2
+    for record in records:
+        result = run_statistics('--no-cache', '--since', record.pop('since'), '--until', record.pop('until'))
+        assert record == OrderedDict(sorted(result.items()))
+
+    # --bucket does not apply to the ranges of --windows.
+    with raises(SystemExit):
+        run_statistics_lines('--no-cache', '--windows', str(windows_file), '--bucket', '10m')
+    assert 'not allowed with argument' in capsys.readouterr()[1]
+
+
+def test_main_source_local(run_statistics, run_statistics_lines, monkeypatch, stub_server, tmpdir):
+    """ Tests that the data stored by `statistics ingest` is analyzed with --source local, without API requests. """
+    monkeypatch.setattr(statistics, 'argv', ['statistics', 'ingest', '--api-url', stub_server.url, '--no-cache',
+                                             '--cache-dir', str(tmpdir), '--since', '2017-06-09 10:00:00',
+                                             '--until', '2017-06-09 11:59:59'])
+    statistics.main()
+    del stub_server.requested_paths[:]
+
+    for top in ('10', '25'):
+        arguments = ['--top', top, '--since', '2017-06-09 10:20:00', '--until', '2017-06-09 11:10:00']
+        result = run_statistics('--source', 'local', '--cache-dir', str(tmpdir), *arguments)
+        assert not stub_server.requested_paths, "No request should reach the API"
+        assert result == run_statistics('--no-cache', *arguments)
+        del stub_server.requested_paths[:]
+
+    records = run_statistics_lines('--source', 'local', '--cache-dir', str(tmpdir), '--bucket', '30m',
+                                   '--since', '2017-06-09 10:00:00', '--until', '2017-06-09 11:59:59')
+    assert len(records) == 4 and not stub_server.requested_paths
+
+
+def test_main_workers(run_statistics, run_statistics_lines, stub_server, tmpdir):
+    """ Tests that sharding the sub-windows across worker processes produces the same results. """
+    arguments = ['--since', '2017-06-09 10:00:00', '--until', '2017-06-09 12:59:59']
+    expected = run_statistics('--no-cache', *arguments)
+    requests = len(stub_server.requested_paths)
+    del stub_server.requested_paths[:]
+
+    assert run_statistics('--no-cache', '--workers', '3', *arguments) == expected
+    assert len(stub_server.requested_paths) == requests, "Every sub-window should be requested once"
+    assert run_statistics_lines('--workers', '2', '--cache-dir', str(tmpdir), '--bucket', '1h', *arguments) == \
+        run_statistics_lines('--workers', '1', '--cache-dir', str(tmpdir), '--bucket', '1h', *arguments)
+
+
+def test_main_output_file(run_statistics_lines, tmpdir):
+    """ Tests that --output-format csv writes a row per statistic and top answer, of every window, to --output-file. """
+    output_file = tmpdir.join('statistics.csv')
+    assert run_statistics_lines('--no-cache', '--output-format', 'csv', '--output-file', str(output_file),
+                                '--bucket', '1h', '--since', '2017-06-09 10:00:00',
+                                '--until', '2017-06-09 11:59:59') == []
+
+    rows = list(csv.reader(output_file.open()))
+    assert rows[0] == ['since', 'until', 'statistic', 'answer_id', 'value']
+    assert len([row for row in rows if row[2] == 'comment_count']) == 20
+    assert set((row[0], row[1]) for row in rows[1:]) == \
+        set([('2017-06-09 10:00:00', '2017-06-09 10:59:59'), ('2017-06-09 11:00:00', '2017-06-09 11:59:59')])
+
+    # A failed run leaves the previous output in place.
+    with raises(SystemExit):
+        run_statistics_lines('--no-cache', '--output-format', 'csv', '--output-file', str(output_file),
+                             '--api-filter', '!missing', '--since', '2017-06-09 10:00:00',
+                             '--until', '2017-06-09 11:59:59')
+    assert list(csv.reader(output_file.open())) == rows
+    assert tmpdir.listdir() == [output_file]
+
+
+def test_main_metrics(run_statistics, stub_server, tmpdir):
+    """ Tests that --metrics records the phases and the API requests of a run, and --profile dumps its profile. """
+    metrics_file, profile_file = tmpdir.join('metrics.json'), tmpdir.join('statistics.prof')
+    run_statistics('--no-cache', '--metrics', str(metrics_file), '--profile', str(profile_file),
+                   '--since', '2017-06-09 10:00:00', '--until', '2017-06-09 11:59:59')
+
+    metrics = json.loads(metrics_file.read(), object_pairs_hook=OrderedDict)
+    assert list(metrics['phases']) == ['answers', 'comments', 'output']
+    assert metrics['api']['requests'] == metrics['responses'] == len(stub_server.requested_paths)
+    assert 0 < metrics['latency_p50_seconds'] <= metrics['latency_p95_seconds']
+    assert metrics['bytes_downloaded'] > 0
+    assert metrics['peak_rss_kilobytes'] > 0
+    # The pages are parsed by the threads of the transport, which are profiled along with the main thread.
+    assert any(function_name == '__iter__' and filename.endswith('jsonstream.py')
+               for filename, _, function_name in pstats.Stats(str(profile_file)).stats)
+
+    # A failed run writes the metrics of the requests it sent.
+    with raises(SystemExit):
+        run_statistics('--no-cache', '--metrics', str(metrics_file), '--api-filter', '!missing',
+                       '--since', '2017-06-09 10:00:00', '--until', '2017-06-09 11:59:59')
+    metrics = json.loads(metrics_file.read(), object_pairs_hook=OrderedDict)
+    assert list(metrics['phases']) == ['answers'] and metrics['api']['requests'] > 0
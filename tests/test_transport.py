@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests the HTTP transports of the application.
+"""
+from stackstatistics.transport import SyncTransport, AsyncTransport
+
+
+def test_transports(stub_server):
+    """ Tests that both transports return the responses in order, and that the async one keeps its connections. """
+    urls = ['{0}/2.2/answers?pagesize=1&page={1}'.format(stub_server.url, page) for page in range(1, 21)]
+    for transport_class in (SyncTransport, AsyncTransport):
+        stub_server.connections = 0
+        transport = transport_class(4)
+        pages = transport.map(lambda url: transport.get(url).json(), urls)
+        transport.close()
+        assert len(pages) == 20
+        assert [page['items'][0]['score'] for page in pages] == \
+            sorted((page['items'][0]['score'] for page in pages), reverse=True)
+    assert stub_server.connections <= 4, "The async transport should reuse its connections"
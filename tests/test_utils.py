@@ -3,12 +3,20 @@
 """
 Tests the utilities of the application.
 """
-from datetime import datetime
-
-from pytest import fixture, raises
-
-from stackstatistics.utils import APIRequest, ResultDictionaryFactory
+import json
+import time
+import pickle
+import threading
+from StringIO import StringIO
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pytest import fixture, importorskip, raises
+
+from stackstatistics.utils import APIRequest, APIResponseError, Item, PrintOption, ResultDictionaryFactory
+from stackstatistics import constants
 from stackstatistics.constants import API_SUCCESS_CODE_RESPONSE
+from stub_server import GeneratedAnswers, GeneratedComments, StubStackExchangeServer, record_fixture
 
 
 @fixture
@@ -33,8 +41,8 @@ def response_keys():
 
 @fixture
 def response_item_array_keys():
-    return ['owner', 'is_accepted', 'score', 'last_activity_date',
-            'last_edit_date', 'creation_date', 'answer_id', 'question_id']
+    # The fields of the minimal filter.
+    return ['is_accepted', 'score', 'creation_date', 'answer_id', 'question_id']
 
 
 @fixture
@@ -122,6 +130,160 @@ def test_api_request_with_invalid_arguments(invalid_input_arguments, invalid_num
         api_request_instance.retrieve_answers()
 
 
+def test_api_request_paginated_answers_retrieval(stub_server, stub_answers, stub_since):
+    """ Tests that retrieve_all_answers pages through every sub-window of the date/time range. """
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3),
+               'api_url': stub_server.url, 'concurrency': 3}
+    answers = APIRequest(options).retrieve_all_answers()
+
+    assert len(answers) == len(stub_answers), "Every answer should be retrieved, beyond the first page"
+    assert len(set(answer['answer_id'] for answer in answers)) == len(answers), "Answers should be unique"
+    scores = [answer['score'] for answer in answers]
+    assert scores == sorted(scores, reverse=True), "Answers should be ordered by score"
+    assert any('&page=2' in path for path in stub_server.requested_paths), "The has_more pages should be requested"
+
+    # An error response is raised instead of exiting the application.
+    options['api_url'] = '{0}/missing'.format(stub_server.url)
+    with raises(APIResponseError):
+        APIRequest(options).retrieve_all_answers()
+
+
+def test_api_request_cached_answers_retrieval(tmpdir, stub_server, stub_since):
+    """ Tests that a repeated retrieval is served from the response cache. """
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3),
+               'api_url': stub_server.url, 'cache_dir': str(tmpdir)}
+    answers = APIRequest(options).retrieve_all_answers()
+    number_of_requests = len(stub_server.requested_paths)
+
+    cached_api_request = APIRequest(options)
+    assert cached_api_request.retrieve_all_answers() == answers
+    assert len(stub_server.requested_paths) == number_of_requests, "No request should reach the API"
+    assert cached_api_request.cache.hits == number_of_requests
+
+    options['no_cache'] = True
+    assert APIRequest(options).cache is None
+
+
+def test_api_request_batched_comments_retrieval(stub_server, stub_answers, stub_comments, stub_since):
+    """ Tests that retrieve_all_comments batches the answer ids and pages through the comments. """
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3), 'api_url': stub_server.url}
+    answer_ids = [answer['answer_id'] for answer in stub_answers]
+    comments = APIRequest(options).retrieve_all_comments(answer_ids)
+
+    assert sorted(comment['comment_id'] for comment in comments) == \
+        sorted(comment['comment_id'] for comment in stub_comments), "Every comment should be retrieved once"
+    comment_paths = [path for path in stub_server.requested_paths if '/comments' in path]
+    assert len([path for path in comment_paths if '&page=1' in path]) == 3, "The ids should be sent in batches of 100"
+    assert APIRequest(options).retrieve_all_comments([]) == []
+
+
+def test_api_request_comment_counts(tmpdir, stub_server, stub_answers, stub_since):
+    """ Tests that count_comments retrieves the counts the memo lacks once, across threads and runs. """
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3), 'api_url': stub_server.url,
+               'cache_dir': str(tmpdir)}
+    creation_dates = dict((answer['answer_id'], answer['creation_date']) for answer in stub_answers[:150])
+    expected = dict((answer_id, answer_id % 4) for answer_id in creation_dates)
+
+    api_request = APIRequest(options)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(api_request.count_comments(creation_dates)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    api_request.close()
+    assert results == [expected] * 4
+    comment_pages = [path for path in stub_server.requested_paths if '/comments' in path]
+    assert len(comment_pages) == len(set(comment_pages)), "Every page should be requested once"
+    assert len([path for path in comment_pages if '&page=1' in path]) == 2, "The ids should be sent in 2 batches"
+
+    # The counts are remembered by the next run too, without the response cache.
+    tmpdir.join(constants.CACHE_DATABASE_NAME).remove()
+    del stub_server.requested_paths[:]
+    more_creation_dates = dict((answer['answer_id'], answer['creation_date']) for answer in stub_answers)
+    assert APIRequest(options).count_comments(more_creation_dates) == \
+        dict((answer_id, answer_id % 4) for answer_id in more_creation_dates)
+    assert len([path for path in stub_server.requested_paths if '/comments' in path and '&page=1' in path]) == 1, \
+        "Only the 100 answers not counted yet should be requested"
+
+
+def test_api_request_filters(stub_since):
+    """ Tests that the minimal filter is created once and cuts the fields and the bytes of the gzip responses. """
+    # Answers with every field of the default filter.
+    stub_server = StubStackExchangeServer(GeneratedAnswers(300, int(time.mktime(stub_since.timetuple())), 3 * 3600),
+                                          GeneratedComments()).start()
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3), 'api_url': stub_server.url}
+    transfers = dict()
+    try:
+        for api_filter in ('minimal', 'default'):
+            api_request = APIRequest(dict(options, api_filter=api_filter))
+            answers = api_request.retrieve_all_answers()
+            comments = api_request.retrieve_all_comments([answer['answer_id'] for answer in answers])
+            transfers[api_filter] = api_request.scheduler.stats()
+            api_request.close()
+            if api_filter == 'minimal':
+                assert set(answers[0]) == set(['answer_id', 'question_id', 'score', 'is_accepted', 'creation_date'])
+                assert set(comments[0]) == set(['comment_id', 'post_id'])
+                assert len([path for path in stub_server.requested_paths if '/filters/create' in path]) == 1
+                assert all('&filter=' in path for path in stub_server.requested_paths
+                           if '/filters/create' not in path)
+            else:
+                assert 'owner' in answers[0]
+    finally:
+        stub_server.stop()
+
+    assert 0 < transfers['minimal']['bytes_received'] < transfers['minimal']['bytes_decoded'], \
+        "The responses should be gzip compressed"
+    assert transfers['minimal']['bytes_decoded'] < transfers['default']['bytes_decoded'] / 2
+
+
+
+def test_api_request_filter_id(stub_server, stub_since):
+    """ Tests that a filter id is used as given. """
+    options = {'since': stub_since, 'until': stub_since + timedelta(hours=3), 'api_url': stub_server.url}
+    with raises(APIResponseError):
+        APIRequest(dict(options, api_filter='!missing')).retrieve_all_answers()
+    assert all('&filter=%21missing' in path for path in stub_server.requested_paths)
+
+
+def test_api_request_windows(stub_since):
+    """ Tests that overlapping date/time ranges are covered by whole, shared sub-windows. """
+    date_ranges = [(stub_since, stub_since + timedelta(hours=5, minutes=30)),
+                   (stub_since + timedelta(hours=2, minutes=15), stub_since + timedelta(hours=3)),
+                   (stub_since + timedelta(hours=8), stub_since + timedelta(hours=9, seconds=-1))]
+    api_request = APIRequest({'since': stub_since, 'until': stub_since + timedelta(hours=9), 'no_cache': True})
+    windows = api_request.windows(date_ranges)
+    api_request.close()
+
+    assert windows == sorted(windows)
+    assert all(window[1] < next_window[0] for window, next_window in zip(windows, windows[1:]))
+    timestamps = [(int(time.mktime(since.timetuple())), int(time.mktime(until.timetuple())))
+                  for since, until in date_ranges]
+    # Every range is the exact union of the sub-windows within it.
+    for (since, until), range_windows in zip(timestamps, APIRequest.windows_within(date_ranges, windows)):
+        assert range_windows[0][0] == since and range_windows[-1][1] == until
+        assert all(window[1] + 1 == next_window[0] for window, next_window in zip(range_windows, range_windows[1:]))
+    assert len(windows) == 9
+
+
+def test_api_request_recorded_fixture_replay(tmpdir, stub_server, stub_answers, stub_since):
+    """ Tests that the answers and comments recorded into a fixture are replayed by a stub server. """
+    fixture_path = str(tmpdir.join('fixture.json'))
+    record_fixture(fixture_path, stub_since, stub_since + timedelta(hours=3), stub_server.url)
+    replay_server = StubStackExchangeServer.from_fixture(fixture_path).start()
+    try:
+        options = {'since': stub_since, 'until': stub_since + timedelta(hours=3), 'api_url': replay_server.url,
+                   'max_requests_per_second': 100}
+        api_request = APIRequest(options)
+        assert api_request.scheduler.min_interval == 0.01
+        answer_ids = [answer['answer_id'] for answer in api_request.retrieve_all_answers()]
+        assert sorted(answer_ids) == sorted(answer['answer_id'] for answer in stub_answers)
+        assert len(api_request.retrieve_all_comments(answer_ids)) == len(replay_server.comments)
+    finally:
+        replay_server.stop()
+
+
 def test_result_dictionary_factory_class(result_dictionary_keys, answers_per_question, comments_per_answer):
     """ Tests the ResultDictionaryFactory class. """
     # Set up a fixed list and calculate its mean value.
@@ -142,3 +304,60 @@ def test_result_dictionary_factory_class(result_dictionary_keys, answers_per_que
     # test the mean function
     mean_value_of_accepted_answers_score_list = ResultDictionaryFactory.mean(accepted_answers_score_list)
     assert mean_value_of_accepted_answers_score_list == mean_value
+
+
+def test_api_response_error_pickling():
+    """ Tests that API errors survive pickling, to be raised by worker processes. """
+    error = pickle.loads(pickle.dumps(APIResponseError(400, {'error_name': 'bad_parameter', 'error_message': 'ids'})))
+    assert (error.status_code, error.error_name, str(error)) == \
+        (400, 'bad_parameter', 'Status code: 400. Reason: ids: bad_parameter')
+
+
+@fixture
+def result_record():
+    return OrderedDict([('since', '2017-06-09 10:00:00'), ('until', '2017-06-09 11:00:00'),
+                        ('accepted_answers_average_score', 2.5), ('total_accepted_answers', 4),
+                        ('top_ten_answers_comment_count', OrderedDict([(44453729, 1), (44466436, 3)]))])
+
+
+def test_print_option_streaming_formats(result_record):
+    """ Tests the json, jsonl and csv output of the PrintOption class, written to a stream. """
+    stream = StringIO()
+    PrintOption(result_record, stream).jsonl()
+    PrintOption(result_record, stream).json()
+    lines = stream.getvalue().splitlines()
+    assert json.loads(lines[0], object_pairs_hook=OrderedDict) == json.loads('\n'.join(lines[1:]))
+    assert json.loads(lines[0])['top_ten_answers_comment_count'] == {'44453729': 1, '44466436': 3}
+
+    stream = StringIO()
+    PrintOption(result_record, stream).csv()
+    PrintOption(result_record, stream).csv(header=False)
+    rows = stream.getvalue().splitlines()
+    assert rows[:5] == ['since,until,statistic,answer_id,value',
+                        '2017-06-09 10:00:00,2017-06-09 11:00:00,accepted_answers_average_score,,2.5',
+                        '2017-06-09 10:00:00,2017-06-09 11:00:00,total_accepted_answers,,4',
+                        '2017-06-09 10:00:00,2017-06-09 11:00:00,comment_count,44453729,1',
+                        '2017-06-09 10:00:00,2017-06-09 11:00:00,comment_count,44466436,3']
+    assert rows[5:] == rows[1:5]
+
+
+def test_print_option_html(result_record):
+    """ Tests that the HTML output, printed a row at a time, is the one of flask_table. """
+    flask_table = importorskip('flask_table')
+
+    class ItemTable(flask_table.Table):
+        name = flask_table.Col('Statistics')
+        description = flask_table.Col('Values')
+
+    class ItemSubTable(flask_table.Table):
+        name = flask_table.Col('answer_id')
+        description = flask_table.Col('comment_count')
+
+    result_record['<escaped & "quoted">'] = "it's"
+    for comments_per_answer in (result_record['top_ten_answers_comment_count'], {}):
+        items = [Item(answer_id, comment_count) for answer_id, comment_count in comments_per_answer.items()]
+        stream = StringIO()
+        PrintOption(result_record, stream).html(iter(items))
+        expected = ItemTable([Item(key, value) if key != 'top_ten_answers_comment_count'
+                              else Item(key, ItemSubTable(items)) for key, value in result_record.items()])
+        assert stream.getvalue() == expected.__html__() + '\n'
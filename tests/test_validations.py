@@ -3,12 +3,13 @@
 """
 Tests the validations of the application.
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 from argparse import ArgumentTypeError
 
 from pytest import fixture, raises
 
-from stackstatistics.validations import valid_date_is
+from stackstatistics.validations import valid_date_is, valid_duration, valid_non_negative_int, valid_positive_number, \
+    valid_windows_file
 
 
 @fixture
@@ -28,3 +29,45 @@ def test_valid_date_is(valid_input_date, invalid_input_date):
     # Ensure that invalid input raises the related error.
     with raises(ArgumentTypeError):
         valid_date_is(invalid_input_date)
+
+
+def test_valid_non_negative_int():
+    """ Tests the valid_non_negative_int function for valid and invalid input. """
+    assert valid_non_negative_int('0') == 0
+    assert valid_non_negative_int('3') == 3
+
+    for invalid_number in ('-1', '1.5', 'many'):
+        with raises(ArgumentTypeError):
+            valid_non_negative_int(invalid_number)
+
+
+def test_valid_positive_number():
+    """ Tests the valid_positive_number function for valid and invalid input. """
+    assert valid_positive_number('2.5') == 2.5
+
+    for invalid_number in ('0', '-1', 'nan', 'fast'):
+        with raises(ArgumentTypeError):
+            valid_positive_number(invalid_number)
+
+
+def test_valid_duration():
+    """ Tests the valid_duration function for valid and invalid input. """
+    assert valid_duration('90s') == timedelta(seconds=90)
+    assert valid_duration('1H') == timedelta(hours=1)
+
+    for invalid_duration in ('0h', '1w', 'h', '-1d'):
+        with raises(ArgumentTypeError):
+            valid_duration(invalid_duration)
+
+
+def test_valid_windows_file(tmpdir, valid_input_date):
+    """ Tests the valid_windows_file function for valid and invalid files. """
+    windows_file = tmpdir.join('windows.csv')
+    windows_file.write('{0},{0}\n\n{0}, {0}\n'.format(valid_input_date))
+    assert valid_windows_file(str(windows_file)) == [(valid_date_is(valid_input_date),) * 2] * 2
+
+    windows_file.write('since,until\n')
+    with raises(ArgumentTypeError):
+        valid_windows_file(str(windows_file))
+    with raises(ArgumentTypeError):
+        valid_windows_file(str(tmpdir.join('missing.csv')))